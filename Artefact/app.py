@@ -1,243 +1,148 @@
 # Importing modules
-from flask import Flask, render_template, request, jsonify, redirect
-from dash import dash, html, dash_table, dcc, callback, Output, Input
-import plotly.express as px
-import pandas as pd
-import sqlite3
-from collections import Counter
+import time
+
+# Record when the module started loading, to report the startup time
+startTime = time.perf_counter()
 
-# Load the cleaned data
-df = pd.read_csv(r"data/cleanedData.csv")
+from flask import Flask, render_template, request, jsonify, redirect, Response, stream_with_context
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+from flask import g
+import compression
+import dataStore
+import metrics
+import surveyDatabase
 
 # Initialise the Flask server
 server = Flask(__name__)
 
-# Initialise the first Dash app
-app1 = dash.Dash(__name__, server=server, routes_pathname_prefix="/dash1/")
-
-# Define the layout of the first Dash app
-app1.layout = html.Div([
-    # Title of the app
-    html.H1(children='Annual Earnings Estimates and Associated Annual Change by Sex and NACE Rev 2 Sector', style={'textAlign': 'center'}),
-
-    # Dropdown to filter by sex
-    html.Div([
-        dcc.Dropdown(
-            id='sex-dropdown',
-            options=[{'label': sex, 'value': sex} for sex in df['Sex'].unique()],
-            value='Both sexes'
-        ),
-    ]),
-
-    # Dropdown to filter by sector
-    html.Div([
-        dcc.Dropdown(
-            id='sector-dropdown',
-            options=[{'label': sector, 'value': sector} for sector in df['NACE Rev 2 Sector'].unique()],
-            value='Accommodation and food service activities (I)'
-        ),
-        # Radio Buttons to select the data points to be displayed
-         dcc.RadioItems(
-            options=['Median Annual Earnings (€)', 'Annual Change (%)'],
-            value='Median Annual Earnings (€)',
-            id='graph-controls'
-        ),       
-    ]),
-
-    dcc.Graph(id='graph-content')
-])
-
-# Define the callback function to update the graph based on the selected filters
-@app1.callback(
-    Output('graph-content', 'figure'),
-    Input('sex-dropdown', 'value'),
-    Input('sector-dropdown', 'value'),
-    Input('graph-controls', 'value')
-)
-def updateGraph1(sex, sector, column):
-    # Filter the data based on the selected sex and sector
-    dff = df[(df['Sex'] == sex) & (df['NACE Rev 2 Sector'] == sector)]
-    # Return the line graph of the selected data
-    return px.line(dff, x='Year', y=column, title=f'{column} for {sector} by Year ({sex})')
-
-# Initalise the second Dash app
-app2 = dash.Dash(__name__, server=server, routes_pathname_prefix="/dash2/")
-
-# Define the layout of the second Dash app
-app2.layout = html.Div([
-    # Title of the app
-    html.H1(children='Annual Earnings Estimates and Associated Annual Change by Sex and NACE Rev 2 Sector', style={'textAlign': 'center'}),
-
-    # Dropdown to filter by year
-    html.Div([
-        dcc.Dropdown(
-            id='year-dropdown',
-            options=[{'label': str(year), 'value': str(year)} for year in df['Year'].unique()],
-            value='2023'
-        ),
-    ]),
-
-    # Dropdown to filter by sex
-    html.Div([
-        dcc.Dropdown(
-            id='sex-dropdown',
-            options=[{'label': sex, 'value': sex} for sex in df['Sex'].unique()],
-            value='Both sexes'
-        ),
-        # Radio Buttons to select the data points to be displayed
-        dcc.RadioItems(
-            options=['Median Annual Earnings (€)', 'Annual Change (%)'],
-            value='Median Annual Earnings (€)',
-            id='graph-controls'
-        ),
-    ]),
-
-    dcc.Graph(id='graph-content', style={'height': '700px', 'width': '100%'})
-])
-
-# Define the callback function to update the graph based on the selected filters
-@app2.callback(
-    Output('graph-content', 'figure'),
-    Input('sex-dropdown', 'value'),
-    Input('year-dropdown', 'value'),
-    Input('graph-controls', 'value')
-)
-# Function to update the graph based on the selected filters
-def updateGraph2(sex, year, column):
-    # Filter the data based on the selected sex and year
-    dff = df[(df['Sex'] == sex) & (df['Year'] == int(year))]
-    # Return the bar chart of the selected data
-    return px.histogram(dff, x='NACE Rev 2 Sector', y=column, title=f'{column} in {year} by Sector ({sex})')
-
-# Load the gender pay gap dataset
-gpg = pd.read_csv("data/genderPayGap.csv")
-
-# Initialise the third Dash app
-app3 = dash.Dash(__name__, server=server, routes_pathname_prefix="/dash3/")
-
-# Define the layout of the third Dash app
-app3.layout = html.Div([
-    # Title of the app
-    html.H2("Gender Pay Gap By NACE Rev 2 Sector"),
-    # Create a table from the gender pay gap dataset
-    dash_table.DataTable(
-        id='table',
-        columns=[{"name": i, "id": i} for i in gpg.columns],
-        data=gpg.to_dict('records'),
-        page_size=13,
-        style_table={'overflowX': 'auto'},
-        style_cell={'textAlign': 'left', 'padding': '8px'},
-        style_header={'backgroundColor': 'lightgrey', 'fontWeight': 'bold'}
-    )
-])
-
-# Load the sector summary dataset
-sectSum = pd.read_csv("data/sectorSummary.csv")
-
-# Initialise the fourth Dash app
-app4 = dash.Dash(__name__, server=server, routes_pathname_prefix="/dash4/")
-
-# Define the layout of the fourth Dash app
-app4.layout = html.Div([
-    # Title of the app
-    html.H2("Sector Summary"),
-    # Create a table from the sector summary dataset
-    dash_table.DataTable(
-        id='table',
-        columns=[{"name": i, "id": i} for i in sectSum.columns],
-        data=sectSum.to_dict('records'),
-        page_size=14,
-        style_table={'overflowX': 'auto'},
-        style_cell={'textAlign': 'left', 'padding': '8px'},
-        style_header={'backgroundColor': 'lightgrey', 'fontWeight': 'bold'}
-    )
-])
-
-# Load the sex summary dataset
-sexSum = pd.read_csv("data/sexSummary.csv")
-
-# Initialise the fifth Dash app
-app5 = dash.Dash(__name__, server=server, routes_pathname_prefix="/dash5/")
-
-# Define the layout of the fifth Dash app
-app5.layout = html.Div([
-    # Title of the app
-    html.H2("Sex Summary"),
-    # Create a table from the sex summary dataset
-    dash_table.DataTable(
-        id='table',
-        columns=[{"name": i, "id": i} for i in sexSum.columns],
-        data=sexSum.to_dict('records'),
-        page_size=3,
-        style_table={'overflowX': 'auto'},
-        style_cell={'textAlign': 'left', 'padding': '8px'},
-        style_header={'backgroundColor': 'lightgrey', 'fontWeight': 'bold'}
-    )
-])
-
-# Load the year summary dataset
-yearSum = pd.read_csv("data/yearSummary.csv")
-
-# Initialise the sixth Dash app
-app6 = dash.Dash(__name__, server=server, routes_pathname_prefix="/dash6/")
-
-# Define the layout of the sixth Dash app
-app6.layout = html.Div([
-    # Title of the app
-    html.H2("Year Summary"),
-    # Create a table from the year summary dataset
-    dash_table.DataTable(
-        id='table',
-        columns=[{"name": i, "id": i} for i in yearSum.columns],
-        data=yearSum.to_dict('records'),
-        page_size=14,
-        style_table={'overflowX': 'auto'},
-        style_cell={'textAlign': 'left', 'padding': '8px'},
-        style_header={'backgroundColor': 'lightgrey', 'fontWeight': 'bold'}
-    )
-])
+# URL prefixes of the Dash apps, the apps themselves are only built when their prefix is first requested
+dashPrefixes = ['/dash1', '/dash2', '/dash3', '/dash4', '/dash5', '/dash6']
+dashApps = {}
+dashAppsLock = threading.Lock()
+
+# Function to get the Dash app for a prefix, building it (and importing Dash and the data) on first use
+def getDashApp(prefix):
+    dashApp = dashApps.get(prefix)
+    if dashApp is None:
+        with dashAppsLock:
+            dashApp = dashApps.get(prefix)
+            if dashApp is None:
+                buildStart = time.perf_counter()
+                import dashApps as builders
+                dashApp = builders.dashAppBuilders[prefix](prefix + "/")
+                dashApps[prefix] = dashApp
+                print(f"Built Dash app {prefix}/ in {time.perf_counter() - buildStart:.2f}s")
+    return dashApp
+
+# Function to send requests for a Dash app prefix to that app and everything else to the Flask server
+def dispatchRequest(environ, start_response):
+    # Check for newly published pipeline outputs in the background of every process that serves requests
+    dataStore.startWatcher()
+    path = environ.get('PATH_INFO', '')
+    for prefix in dashPrefixes:
+        # Redirect the bare prefix to the Dash app's home page, keeping the query string
+        if path == prefix:
+            query = environ.get('QUERY_STRING', '')
+            location = environ.get('SCRIPT_NAME', '') + prefix + "/" + (f"?{query}" if query else "")
+            return redirect(location, code=308)(environ, start_response)
+        if path.startswith(prefix + "/"):
+            # Label the request by the first part of the path, so versioned asset URLs share one label
+            route = prefix + "/" + path[len(prefix) + 1:].split("/")[0]
+            with metrics.timer('http_request_duration_seconds', route=route, method=environ.get('REQUEST_METHOD', '')):
+                dashApp = getDashApp(prefix)
+                # Move the prefix from the path to the script name, as the Dash app's routes start at "/"
+                environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + prefix
+                environ['PATH_INFO'] = path[len(prefix):]
+                return dashApp.server.wsgi_app(environ, start_response)
+    return flaskApp(environ, start_response)
+
+# Function to build every Dash app straight away instead of on first request
+def preloadDashApps():
+    for prefix in dashPrefixes:
+        getDashApp(prefix)
+
+flaskApp = server.wsgi_app
+server.wsgi_app = dispatchRequest
+
+# Record when each Flask request starts
+@server.before_request
+def startRequestTimer():
+    g.requestStart = time.perf_counter()
+
+# Record how long each Flask request took, labelled by its route rather than its full URL
+@server.after_request
+def recordRequestTime(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe('http_request_duration_seconds', {'route': route, 'method': request.method},
+                    time.perf_counter() - g.requestStart)
+    return response
+
+# Compress each response the client accepts compressed, and answer conditional requests for unchanged responses with 304
+server.after_request(compression.encodeResponse)
+
+# Function to serve the static files, sending the gzip or Brotli variants saved by the pipeline to clients that accept them
+def sendStaticFile(filename):
+    response = compression.sendStaticFile(filename, server.static_folder)
+    return response if response is not None else server.send_static_file(filename)
+
+server.view_functions['static'] = sendStaticFile
+
+# Define the route for the metrics in the Prometheus text format
+@server.route('/metrics')
+def metricsPage():
+    return Response(metrics.renderMetrics(), mimetype='text/plain; version=0.0.4')
 
 # Initialise the SQLite database
-def init_db():
-    conn = sqlite3.connect('survey.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS responses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sector TEXT,
-            factors TEXT,
-            payGap REAL,
-            '''
-            # Add a column to store the value of the response to 
-            # the government question as a boolean
-            '''
-            gov BOOLEAN
-        )
-    ''')
-    conn.commit()
-    conn.close()
-init_db()
+surveyDatabase.initDatabase()
+
+# Optionally batch survey submissions into a single transaction from a background thread
+if os.environ.get('SURVEY_WRITE_BEHIND') == '1':
+    surveyDatabase.enableWriteBehind()
+
+# Function to render a page that only changes with the pipeline outputs, once for each snapshot of the data and URL root
+@dataStore.part('page')
+def renderPage(snapshot, templateName, scriptRoot):
+    # Rendered in a request context of its own, as snapshots can be built by the reload thread
+    with server.test_request_context(base_url="http://localhost" + scriptRoot):
+        body = render_template(templateName)
+    etag = hashlib.sha256(json.dumps([snapshot['stamp'], body]).encode("utf-8")).hexdigest()[:32]
+    return {'body': body, 'etag': etag, 'lastModified': dataStore.getReleaseTime(snapshot)}
+
+# Function to send a page rendered for the current data, with validators so a client with a matching copy gets a 304 response
+def sendPage(templateName):
+    page = dataStore.getPart(('page', templateName, request.script_root))
+    response = Response(page['body'], mimetype='text/html')
+    response.set_etag(page['etag'])
+    response.last_modified = page['lastModified']
+    response.cache_control.no_cache = True
+    return response
 
 # Define the route for the home page of the Flask server
 @server.route('/')
 def home():
-    # Render the home page
-    return render_template('index.html')
+    # Send the home page
+    return sendPage('index.html')
 
 # Define the route for the Pygal graphs page
 @server.route('/pygal')
 def pygalCharts():
-    return render_template('pygal.html')
+    return sendPage('pygal.html')
 
 # Define the route for the Dash graphs page                       
 @server.route('/dash')
 def dashCharts():
-    return render_template('dash.html')
+    return sendPage('dash.html')
 
 # Define the route for the data page
 @server.route('/data')
 def render_dash3():
-    return render_template('data.html')
+    return sendPage('data.html')
 
 # Define the route for the survey page
 @server.route('/poll')
@@ -253,40 +158,127 @@ def submit():
     factors = request.form['factors']
     payGap = float(request.form['payGap'])
     gov = bool(int(request.form.get('gov', 0)))
-    with sqlite3.connect('survey.db') as conn:
-        conn.execute("INSERT INTO responses (sector, factors, payGap, gov) VALUES (?, ?, ?, ?)", 
-                        (sector, factors, payGap, gov))
+    surveyDatabase.insertResponse(sector, factors, payGap, gov)
     print("Form submitted successfully.")
     
     # Redirect to the summary page after submission
     return redirect('/summary')
 
+# Define the route to add a batch of survey responses sent as JSON or NDJSON
+@server.route('/api/responses', methods=['POST'])
+def importResponses():
+    # Imported on first use so pandas is not loaded when the server starts
+    import surveyImport
+    try:
+        records, errors = surveyImport.parseBody(request.get_data(as_text=True), request.mimetype)
+    except ValueError as e:
+        return jsonify({'inserted': 0, 'errors': [{'row': None, 'errors': {'request': str(e)}}]}), 400
+    rows, errors = surveyImport.validateResponses(records, errors)
+
+    # Reject the whole batch if any response is invalid, unless only the valid responses should be saved
+    partial = request.args.get('partial') == '1'
+    if errors and not partial:
+        return jsonify({'inserted': 0, 'errors': errors}), 422
+
+    # Save the batch in a single transaction, so either every row is saved or none are
+    if rows:
+        try:
+            surveyDatabase.insertResponses(rows)
+        except sqlite3.OperationalError as e:
+            return jsonify({'inserted': 0, 'errors': [{'row': None, 'errors': {'database': str(e)}}]}), 503
+    return jsonify({'inserted': len(rows), 'errors': errors}), 201 if rows else 422
+
+# Query parameters of the earnings API, and the cube dimension or measure each one refers to
+earningsDimensions = {'year': 'Year', 'sex': 'Sex', 'sector': 'NACE Rev 2 Sector', 'ageGroup': 'Age Group'}
+earningsMeasures = {'earnings': 'Median Annual Earnings (€)', 'annualChange': 'Annual Change (%)'}
+
+# Function to answer a query about the cube as JSON, with an ETag so a client with a matching copy gets a 304 response
+def cubeResponse(cube, runQuery):
+    # The answer only depends on the cube and the query string, so the ETag is known before the query is run
+    query = sorted(request.args.lists())
+    etag = hashlib.sha256(json.dumps([request.path, cube['version'], query]).encode("utf-8")).hexdigest()[:32]
+    matchingEtag = compression.getMatchingEtag(etag)
+    if matchingEtag is not None:
+        response = Response(status=304)
+        response.set_etag(matchingEtag)
+        response.vary.add('Accept-Encoding')
+        return response
+    try:
+        rows = runQuery()
+    except KeyError as e:
+        return jsonify({'error': f"Unknown dimension or measure {e}."}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = jsonify({'version': cube['version'], 'rows': rows})
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+# Function to read the cube filters from the query string, each filter can be repeated to select several values
+def getCubeFilters():
+    return {dimension: request.args.getlist(parameter) for parameter, dimension in earningsDimensions.items()
+            if parameter in request.args}
+
+# Define the route to query the earnings cube, filtering and grouping by any of its dimensions
+@server.route('/api/earnings')
+def earnings():
+    # Imported on first use so the cube is only loaded when it is queried
+    import earningsCube
+    cube = earningsCube.getCube()
+    
+    # Function to run the query, e.g. ?year=2022&year=2023&groupBy=sector&statistic=median
+    def runQuery():
+        groupBy = request.args.get('groupBy')
+        if groupBy is not None:
+            groupBy = [earningsDimensions[name] for name in groupBy.split(',') if name]
+        measures = [earningsMeasures[name] for name in request.args.getlist('measure')] or None
+        statistic = request.args.get('statistic', 'mean')
+        return earningsCube.queryCube(cube, getCubeFilters(), groupBy, measures, statistic)
+    
+    return cubeResponse(cube, runQuery)
+
+# Define the route to get the gender pay gap for any slice of the earnings cube, filtered by year, sector and age group
+@server.route('/api/paygap')
+def payGapSlice():
+    import earningsCube
+    import payGap
+    cube = earningsCube.getCube()
+    return cubeResponse(cube, lambda: payGap.queryPayGap(cube, getCubeFilters()))
+
+# Number of responses listed on each page of the summary page
+responsesPageSize = 50
+
+# Function to read the sector and gov filters from the query string
+def getResponseFilters():
+    sector = request.args.get('sector') or None
+    gov = request.args.get('gov')
+    gov = bool(int(gov)) if gov in ('0', '1') else None
+    return sector, gov
+
 @server.route('/summary')
 def summary():
-    # Retrieve the survey responses from the database
-    with sqlite3.connect('survey.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM responses")
-        responses = cursor.fetchall()
-    
-    # Create a DataFrame from the responses    
-    df = pd.DataFrame(responses, columns=['id', 'sector', 'factors', 'payGap', 'gov'])
-    # Convert gov column to a boolean
-    df['gov'] = df['gov'].astype(bool)
+    # Retrieve one page of the survey responses, and the running totals, from the database
+    sector, gov = getResponseFilters()
+    responses, hasPrevious, hasNext = surveyDatabase.fetchResponsePage(
+        responsesPageSize,
+        afterId=request.args.get('after', type=int),
+        beforeId=request.args.get('before', type=int),
+        sector=sector,
+        gov=gov)
+    totals = surveyDatabase.fetchTotals()
     # If there are no responses, render the summary page with no responses
-    if df.empty:
+    if totals['total'] == 0:
         return render_template('summary.html', yes="No responses", no="No responses", message="No survey responses available.")
     
-    # Calculate the mode of the sector column and the mean of the payGap column
-    sectorMode = df['sector'].mode()[0] if not df['sector'].empty else "No responses"
-    payGapMean = df['payGap'].astype(float).mean() if not df['payGap'].empty else 0.0
+    # Get the mode of the sector column and the mean of the payGap column
+    sectorMode = totals['sectorMode']
+    payGapMean = totals['payGapMean']
     
     # Calculate the percentage of yes and no responses
-    totalResponses = len(df)
-    yesCount = (df['gov'] == 1).sum()
-    noCount = (df['gov'] == 0).sum()
-    yesPercentage = round((yesCount / totalResponses) * 100, 2) if totalResponses > 0 else 0
-    noPercentage = round((noCount / totalResponses) * 100, 2) if totalResponses > 0 else 0
+    totalResponses = totals['total']
+    yesPercentage = round((totals['yesCount'] / totalResponses) * 100, 2)
+    noPercentage = round((totals['noCount'] / totalResponses) * 100, 2)
     
     # Render the summary page with the calculated data summary
     return render_template('summary.html', 
@@ -295,27 +287,56 @@ def summary():
                            sector=sectorMode, 
                            payGap=round(payGapMean, 2),
                            responses=responses,
+                           previousId=responses[0][0] if hasPrevious else None,
+                           nextId=responses[-1][0] if hasNext else None,
+                           sectors=surveyDatabase.fetchSectors(),
+                           sectorFilter=sector or '',
+                           govFilter='' if gov is None else str(int(gov)),
                            message=None)
 
+# Define the route to download the survey responses, streamed from the database as CSV or NDJSON
+@server.route('/summary/export')
+def exportResponses():
+    sector, gov = getResponseFilters()
+    columns = ['id', 'sector', 'factors', 'payGap', 'gov']
+    
+    # Function to write the matching responses as CSV, a block of rows at a time
+    def generateCsv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for count, response in enumerate(surveyDatabase.iterateResponses(sector, gov), start=1):
+            writer.writerow(response)
+            if count % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    # Function to write the matching responses as one JSON object per line
+    def generateNdjson():
+        for response in surveyDatabase.iterateResponses(sector, gov):
+            record = dict(zip(columns, response))
+            record['gov'] = bool(record['gov'])
+            yield json.dumps(record) + "\n"
+    
+    if request.args.get('format') == 'ndjson':
+        return Response(stream_with_context(generateNdjson()), mimetype='application/x-ndjson',
+                        headers={'Content-Disposition': 'attachment; filename=responses.ndjson'})
+    return Response(stream_with_context(generateCsv()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=responses.csv'})
+
 # Define the route for the recommendations page
 @server.route('/recommendations')
 def recommendations():
-    with sqlite3.connect('survey.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM responses")
-        responses = cursor.fetchall()
-    
-    # Create a DataFrame from the responses
-    df = pd.DataFrame(responses, columns=['id', 'sector', 'factors', 'payGap', 'gov'])
-    df['gov'] = df['gov'].astype(bool)
-    if df.empty:
+    # Retrieve the running totals of the survey responses from the database
+    totals = surveyDatabase.fetchTotals()
+    if totals['total'] == 0:
         return render_template('recommendations.html', message="No responses available to make recommendations.")
-    payGapMean = df['payGap'].astype(float).mean() if not df['payGap'].empty else 0.0
-    totalResponses = len(df)
-    yesCount = (df['gov'] == 1).sum()
-    noCount = (df['gov'] == 0).sum()
-    yesPercentage = round((yesCount / totalResponses) * 100, 2) if totalResponses > 0 else 0
-    noPercentage = round((noCount / totalResponses) * 100, 2) if totalResponses > 0 else 0
+    payGapMean = totals['payGapMean']
+    totalResponses = totals['total']
+    yesPercentage = round((totals['yesCount'] / totalResponses) * 100, 2)
+    noPercentage = round((totals['noCount'] / totalResponses) * 100, 2)
     
     # Determine the consensus message
     if yesPercentage > 50:
@@ -326,7 +347,10 @@ def recommendations():
         consensusMessage = "Based on the survey responses, there is no clear consensus on whether the government is doing enough to address the gender pay gap."
     
     # Calculate the percentage difference between the mean estimated gender pay gap and the actual statistic
-    actualPayGap = 17.27  # From the genderPayGap csv as the statistic for gender pay gap for All NACE Rev 2 Sectors in 2023
+    # The actual statistic is the latest gender pay gap for All NACE Rev 2 Sectors in the pipeline outputs currently served
+    actualPayGap = dataStore.getPart('headlinePayGap')
+    if actualPayGap is None:
+        return render_template('recommendations.html', message="The gender pay gap statistics are not available to make recommendations.")
     percentageDifference = (payGapMean - actualPayGap)
     
     # Determine the estimation message
@@ -357,10 +381,7 @@ def recommendations():
         "have a good understanding of the gender pay gap."
     
     # Identify the three most answered responses to the factors question that have occurred three or more times
-    factorsResponses = [response[2] for response in responses]
-    factorsCounter = Counter(factorsResponses)
-    modalFactors = [factor for factor, count in factorsCounter.items() if count >= 3]
-    topFactors = modalFactors[:3]
+    topFactors = surveyDatabase.fetchCommonFactors(3, 3)
 
     # Render the recommendations page with the calculated data
     return render_template('recommendations.html', 
@@ -372,6 +393,9 @@ def recommendations():
                            topFactors=topFactors,
                            message=None)
 
-# Run the Flask Server
+# Report how long the module took to load
+print(f"app.py loaded in {time.perf_counter() - startTime:.2f}s")
+
+# Run the Flask development server, use wsgi.py with gunicorn or waitress for anything else
 if __name__ == "__main__":
     server.run(host="0.0.0.0", port=5000, debug=True)
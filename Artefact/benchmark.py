@@ -0,0 +1,260 @@
+# Importing modules
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Get the directory of the current script
+script_dir = Path(__file__).parent
+
+# Scales of the synthetic source extracts, as multiples of the size of the CSO extract
+defaultScales = [1, 10, 100, 1000]
+
+# Numbers of responses in the synthetic survey databases
+defaultSurveySizes = [1000, 100000]
+
+# Graphs are not drawn above this scale, as pygal draws one line per sector
+defaultGraphMaxScale = 10
+
+# Sectors and factors used for the synthetic survey responses, matching the options on the survey page
+surveySectors = [
+    "Industry (B to E)", "Construction (F)", "Wholesale and retail trade (G)", "Transportation and storage (H)",
+    "Accommodation and food service (I)", "Information and communication (J)", "Financial, insurance, and real estate (K,L)",
+    "Professional, scientific, and technical (M)", "Administrative and support services (N)",
+    "Public administration and defence (O)", "Education (P)", "Human health and social work (Q)",
+    "Arts, entertainment, recreation (R,S)",
+]
+surveyFactors = [
+    "Career breaks for childcare", "Discrimination", "Occupational segregation", "Career progression barriers",
+    "Women in lower-paying roles", "Part-time work", "Negotiation differences",
+]
+
+
+# Function to write a synthetic extract with the same columns as the CSO extract, scale times as many rows
+def createSourceData(path, scale, seed=0):
+    import numpy as np
+    import pandas as pd
+
+    source = pd.read_csv(script_dir / "data/DDA02.20241213T091229.csv")
+    rng = np.random.default_rng(seed)
+    copies = []
+    for copy in range(scale):
+        data = source.copy()
+        # Every copy after the first gets its own sectors, so every sector still has one row per year and sex
+        if copy > 0:
+            data['NACE Rev 2 Sector'] = data['NACE Rev 2 Sector'] + f" #{copy}"
+            isEarnings = data['Statistic Label'] == "Median Annual Earnings"
+            noise = rng.normal(1.0, 0.05, len(data))
+            data.loc[isEarnings, 'VALUE'] = (data.loc[isEarnings, 'VALUE'] * noise[isEarnings]).round()
+            data.loc[~isEarnings, 'VALUE'] = (data.loc[~isEarnings, 'VALUE'] + rng.normal(0, 0.5, len(data))[~isEarnings]).round(1)
+        copies.append(data)
+    data = pd.concat(copies, ignore_index=True)
+    data.to_csv(path, index=False)
+    return len(data)
+
+
+# Function to write a synthetic survey database with a number of random responses
+def createSurveyDatabase(path, responses, seed=0):
+    import surveyDatabase
+
+    Path(path).unlink(missing_ok=True)
+    surveyDatabase.useDatabase(path)
+    surveyDatabase.initDatabase()
+    rng = random.Random(seed)
+    rows = [(rng.choice(surveySectors), rng.choice(surveyFactors), round(rng.uniform(5, 30), 2), rng.random() < 0.4)
+            for _ in range(responses)]
+    surveyDatabase.insertResponses(rows)
+
+
+# Function to time a function and measure the peak memory it allocates, returning its result and the measurements
+def measure(function, *args, repeat=1):
+    # Time the function on its own, keeping the fastest run
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+
+    # Run it once more while tracing allocations, as tracing slows it down
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {'seconds': min(times), 'peakMemoryBytes': peak}
+
+
+# Function to benchmark each stage of the data pipeline on a synthetic extract
+def benchmarkPipeline(workDir, scale, repeat, graphMaxScale):
+    import dataProcessing
+
+    sourcePath = Path(workDir) / f"source{scale}.csv"
+    rows = createSourceData(sourcePath, scale)
+    results = []
+
+    # Function to record the measurements for a stage
+    def record(stage, measurements):
+        results.append({'scale': scale, 'rows': rows, 'stage': stage, **measurements})
+        print(f"  scale {scale:>5}  {stage:<32} {measurements['seconds']:.4f}s  {measurements['peakMemoryBytes'] / 1e6:.1f} MB")
+
+    df, measurements = measure(dataProcessing.readSourceData, sourcePath, repeat=repeat)
+    record("readSourceData", measurements)
+    for column in ['NACE Rev 2 Sector', 'Sex', 'Year']:
+        _, measurements = measure(dataProcessing.getSummary, df, column, repeat=repeat)
+        record(f"getSummary ({column})", measurements)
+
+    male = df[df['Sex'] == 'Male'].drop(columns="Sex")
+    female = df[df['Sex'] == 'Female'].drop(columns="Sex")
+    _, measurements = measure(dataProcessing.gpgStatistics, male, female, repeat=repeat)
+    record("gpgStatistics", measurements)
+
+    if scale <= graphMaxScale:
+        years = sorted(df['Year'].unique().tolist())
+        series, measurements = measure(dataProcessing.getGraphSeries, male, years, repeat=repeat)
+        record("getGraphSeries", measurements)
+        _, measurements = measure(dataProcessing.createGraph, series, "Benchmark", years, repeat=repeat)
+        record("createGraph", measurements)
+    return results
+
+
+# Function to send requests to one route and measure the response times and peak memory
+def benchmarkRoute(client, name, request, requests):
+    # Send one request first so anything built on first use is not measured
+    response = request(client)
+    if response.status_code >= 400:
+        print(f"  {name} returned {response.status_code}")
+
+    times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        request(client).get_data()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    request(client).get_data()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    times.sort()
+    return {
+        'route': name,
+        'requests': requests,
+        'meanSeconds': statistics.mean(times),
+        'p50Seconds': times[len(times) // 2],
+        'p95Seconds': times[min(len(times) - 1, int(len(times) * 0.95))],
+        'peakMemoryBytes': peak,
+    }
+
+
+# Function to build the body of a Dash callback request
+def dashCallback(outputs, inputs):
+    return {
+        'output': outputs[0] if len(outputs) == 1 else ".." + "...".join(outputs) + "..",
+        'outputs': [{'id': output.split('.')[0], 'property': output.split('.')[1]} for output in outputs]
+                   if len(outputs) > 1 else {'id': outputs[0].split('.')[0], 'property': outputs[0].split('.')[1]},
+        'inputs': [{'id': key.split('.')[0], 'property': key.split('.')[1], 'value': value} for key, value in inputs.items()],
+        'changedPropIds': [],
+    }
+
+
+# Requests sent to each route, as a name and a function that sends the request with a test client
+routeRequests = [
+    ("GET /", lambda client: client.get('/')),
+    ("GET /pygal", lambda client: client.get('/pygal')),
+    ("GET /dash", lambda client: client.get('/dash')),
+    ("GET /data", lambda client: client.get('/data')),
+    ("GET /poll", lambda client: client.get('/poll')),
+    ("GET /summary", lambda client: client.get('/summary')),
+    ("GET /recommendations", lambda client: client.get('/recommendations')),
+    ("GET /summary/export", lambda client: client.get('/summary/export')),
+    ("POST /submit", lambda client: client.post('/submit', data={
+        'sector': "Education (P)", 'factors': "Part-time work", 'payGap': "12.5", 'gov': "1"})),
+    ("POST /api/responses (100)", lambda client: client.post('/api/responses', json=[
+        {'sector': "Education (P)", 'factors': "Part-time work", 'payGap': 12.5, 'gov': True}] * 100)),
+    ("POST /dash1 updateGraph1", lambda client: client.post('/dash1/_dash-update-component', json=dashCallback(
+        ['graph-content.figure'],
+        {'sex-dropdown.value': "Female", 'sector-dropdown.value': "Construction (F)", 'graph-controls.value': "Annual Change (%)"}))),
+    ("POST /dash2 updateGraph2", lambda client: client.post('/dash2/_dash-update-component', json=dashCallback(
+        ['graph-content.figure'],
+        {'sex-dropdown.value': "Male", 'year-dropdown.value': "2019", 'graph-controls.value': "Median Annual Earnings (€)"}))),
+    ("POST /dash3 table page", lambda client: client.post('/dash3/_dash-update-component', json=dashCallback(
+        ['table.data', 'table.page_count'],
+        {'table.page_current': 1, 'table.page_size': 13, 'table.sort_by': [{'column_id': "Gender Pay Gap (%)", 'direction': "desc"}],
+         'table.filter_query': "{Year} s>= 2015"}))),
+]
+
+
+# Function to benchmark every route against synthetic survey databases of each size
+def benchmarkRoutes(workDir, surveySizes, requests):
+    results = []
+    databasePaths = {size: Path(workDir) / f"survey{size}.db" for size in surveySizes}
+
+    # The app opens the survey database when it is imported, so point it at a synthetic database first
+    os.environ['SURVEY_DB'] = str(databasePaths[surveySizes[0]])
+    import surveyDatabase
+    for size, path in databasePaths.items():
+        createSurveyDatabase(path, size)
+    surveyDatabase.useDatabase(databasePaths[surveySizes[0]])
+    import app
+    client = app.server.test_client()
+
+    for size, path in databasePaths.items():
+        surveyDatabase.useDatabase(path)
+        for name, request in routeRequests:
+            result = {'responses': size, **benchmarkRoute(client, name, request, requests)}
+            results.append(result)
+            print(f"  {size:>7} responses  {name:<28} p50 {result['p50Seconds'] * 1000:.2f}ms  p95 {result['p95Seconds'] * 1000:.2f}ms")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline and web routes on synthetic data.")
+    parser.add_argument('--scales', type=int, nargs='+', default=defaultScales,
+                        help="sizes of the synthetic extracts, as multiples of the CSO extract")
+    parser.add_argument('--survey-sizes', type=int, nargs='+', default=defaultSurveySizes,
+                        help="numbers of responses in the synthetic survey databases")
+    parser.add_argument('--repeat', type=int, default=3, help="number of timed runs of each pipeline stage")
+    parser.add_argument('--requests', type=int, default=50, help="number of timed requests to each route")
+    parser.add_argument('--graph-max-scale', type=int, default=defaultGraphMaxScale,
+                        help="largest scale at which the graph stages are run")
+    parser.add_argument('--skip-pipeline', action='store_true', help="only benchmark the routes")
+    parser.add_argument('--skip-routes', action='store_true', help="only benchmark the pipeline")
+    parser.add_argument('--output', default="benchmarkResults.json", help="file the results are written to")
+    args = parser.parse_args()
+
+    # Make the modules next to this script importable wherever it is run from
+    sys.path.insert(0, str(script_dir))
+    import pandas as pd
+
+    results = {
+        'run': {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+        },
+        'pipeline': [],
+        'routes': [],
+    }
+    with tempfile.TemporaryDirectory() as workDir:
+        if not args.skip_pipeline:
+            print("Pipeline stages:")
+            for scale in args.scales:
+                results['pipeline'] += benchmarkPipeline(workDir, scale, args.repeat, args.graph_max_scale)
+        if not args.skip_routes:
+            print("Routes:")
+            results['routes'] = benchmarkRoutes(workDir, args.survey_sizes, args.requests)
+
+    # Save the results so runs can be compared
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results saved to {args.output}")
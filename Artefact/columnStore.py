@@ -0,0 +1,140 @@
+# Importing modules
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# Name of the folder, next to the CSV files, that holds the columnar copies
+cacheFolderName = "cache"
+
+
+# Function to get the folder that holds the columnar copy of a CSV file
+def getCachePath(csvPath):
+    csvPath = Path(csvPath)
+    return csvPath.parent / cacheFolderName / csvPath.stem
+
+
+# Function to get the size and modification time of a CSV file so a stale cache can be detected
+def getFileStamp(path):
+    stat = Path(path).stat()
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+# Function to get the smallest type that holds every value of a numeric column exactly, so less memory is mapped
+def getCompactArray(array):
+    if np.issubdtype(array.dtype, np.integer) and len(array) > 0:
+        for dtype in ['int8', 'int16', 'int32']:
+            if np.iinfo(dtype).min <= array.min() and array.max() <= np.iinfo(dtype).max:
+                return array.astype(dtype)
+    elif array.dtype == np.float64:
+        # Values such as whole euro amounts fit in float32, values with decimal places usually do not
+        compact = array.astype('float32')
+        if np.array_equal(compact.astype('float64'), array, equal_nan=True):
+            return compact
+    return array
+
+
+# Function to save an array, always to a new file as a running app may have the arrays of earlier versions mapped
+def saveArray(path, array):
+    with open(path, "wb") as f:
+        np.save(f, array, allow_pickle=False)
+
+
+# Function to create a new folder for a version of a set of arrays, as a file that a process has mapped cannot be
+# replaced on Windows, each version is written to its own folder and the metadata is pointed at it once it is complete
+def createVersionFolder(path):
+    path = Path(path)
+    versionPath = path / f"v{time.time_ns()}-{os.getpid()}"
+    versionPath.mkdir(parents=True)
+    return versionPath
+
+
+# Function to save the metadata of a set of arrays, swapping it in whole so it always describes a complete version
+def saveMeta(path, meta):
+    temporaryPath = Path(path) / f"meta.json.{os.getpid()}.tmp"
+    with open(temporaryPath, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(temporaryPath, Path(path) / "meta.json")
+
+
+# Function to remove the versions of a set of arrays older than the current and previous ones, the previous one is kept
+# for a process that read the metadata just before it changed, and folders that are still mapped on Windows are skipped
+def removeOldVersions(path, currentFolder):
+    versions = sorted((folder for folder in Path(path).iterdir() if folder.is_dir() and folder.name.startswith("v")),
+                      key=lambda folder: folder.stat().st_mtime_ns)
+    for folder in versions[:-2]:
+        if folder.name != currentFolder:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    # Remove the arrays of the layout used before versioned folders
+    for arrayPath in Path(path).glob("*.npy"):
+        try:
+            arrayPath.unlink()
+        except OSError:
+            pass
+
+
+# Function to save a dataframe as one .npy file per column next to the CSV it was written to
+def saveColumns(df, csvPath):
+    cachePath = getCachePath(csvPath)
+    versionPath = createVersionFolder(cachePath)
+
+    columns = []
+    for position, column in enumerate(df.columns):
+        values = df[column]
+        columnMeta = {'name': column, 'file': f"{position}.npy"}
+
+        # Store text columns as integer codes and a list of categories
+        if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+            categorical = values.astype('category')
+            columnMeta['categories'] = [str(category) for category in categorical.cat.categories]
+            array = categorical.cat.codes.to_numpy()
+        else:
+            array = getCompactArray(values.to_numpy())
+        columnMeta['dtype'] = str(array.dtype)
+        saveArray(versionPath / columnMeta['file'], array)
+        columns.append(columnMeta)
+
+    # Write the metadata last, recording which version of the CSV the cache matches and the folder of its arrays
+    saveMeta(cachePath, {'rows': len(df), 'columns': columns, 'source': getFileStamp(csvPath), 'folder': versionPath.name})
+    removeOldVersions(cachePath, versionPath.name)
+
+
+# Function to load the columnar copy of a CSV file, returns None if there is no current copy
+# The columns stay memory-mapped read-only, so every process that loads the same copy shares one copy in memory
+def loadColumns(csvPath):
+    metaPath = getCachePath(csvPath) / "meta.json"
+    if not metaPath.exists():
+        return None
+    with open(metaPath, encoding="utf-8") as f:
+        meta = json.load(f)
+
+    # Ignore the cache if the CSV has been changed since the cache was written, or it was written before versioned folders
+    if Path(csvPath).exists() and getFileStamp(csvPath) != meta['source'] or 'folder' not in meta:
+        return None
+
+    data = {}
+    for columnMeta in meta['columns']:
+        array = np.load(metaPath.parent / meta['folder'] / columnMeta['file'], mmap_mode='r', allow_pickle=False)
+        if 'categories' in columnMeta:
+            data[columnMeta['name']] = pd.Categorical.from_codes(np.asarray(array), columnMeta['categories'])
+        else:
+            data[columnMeta['name']] = np.asarray(array)
+    return pd.DataFrame(data, columns=[columnMeta['name'] for columnMeta in meta['columns']], copy=False)
+
+
+# Function to read a pipeline output, using the columnar copy when it is present and current
+def readData(csvPath):
+    df = loadColumns(csvPath)
+    if df is None:
+        df = pd.read_csv(csvPath)
+        # Write the columnar copy now, so this and every later process can map it instead of keeping its own copy
+        try:
+            saveColumns(df, csvPath)
+            df = loadColumns(csvPath)
+        except OSError as e:
+            print(f"Warning: Could not save a columnar copy of {Path(csvPath).name}: {e}")
+    return df
@@ -0,0 +1,106 @@
+# Importing modules
+import hashlib
+import mimetypes
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from flask import request, send_file
+from werkzeug.security import safe_join
+from staticCompression import compress, compressibleSuffixes, encodingSuffixes, getFileVariants, minimumSize, staticPath
+
+# Types of response that are worth compressing
+compressibleTypes = ['text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript', 'text/javascript',
+                     'image/svg+xml']
+
+# Compressed bodies of responses, keyed by the content and encoding, so a repeated payload is only compressed once
+compressedBodies = {}
+compressedBodiesLock = threading.Lock()
+compressedCacheSize = 256
+
+
+# Function to get a strong ETag from the content of a file, hashed once for each version of the file
+@lru_cache(maxsize=64)
+def getContentEtag(path, size, mtime):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()[:32]
+
+
+# Function to choose the encoding of a response from the request's Accept-Encoding header, None to send it uncompressed
+def chooseEncoding(available):
+    encodings = [encoding for encoding in encodingSuffixes if encoding in available]
+    return request.accept_encodings.best_match(encodings) if encodings else None
+
+
+# Function to get the ETag of a compressed variant, which must differ from the ETag of the uncompressed body
+def getEncodedEtag(etag, encoding):
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+# Function to get the ETag of the copy of a response the client already has, in any encoding, None if it has no copy
+def getMatchingEtag(etag):
+    for encoding in [None] + list(encodingSuffixes):
+        if getEncodedEtag(etag, encoding) in request.if_none_match:
+            return getEncodedEtag(etag, encoding)
+    return None
+
+
+# Function to get the compressed body of a response, compressing each distinct body only once
+def getCompressedBody(key, body, encoding):
+    with compressedBodiesLock:
+        compressed = compressedBodies.get((key, encoding))
+    if compressed is None:
+        compressed = compress(body, encoding)
+        with compressedBodiesLock:
+            # Remove the oldest bodies when the cache is full
+            while len(compressedBodies) >= compressedCacheSize:
+                del compressedBodies[next(iter(compressedBodies))]
+            compressedBodies[(key, encoding)] = compressed
+    return compressed
+
+
+# Function run after each request to compress the response and answer conditional requests with 304 Not Modified
+def encodeResponse(response):
+    # Only whole, successful responses of text types are changed
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in compressibleTypes):
+        return response
+    body = response.get_data()
+    response.vary.add('Accept-Encoding')
+
+    # Give responses to GET requests a strong ETag from their content, unless the route set one or they never change
+    etag = response.get_etag()[0]
+    cacheable = request.method in ('GET', 'HEAD')
+    if etag is None and cacheable and response.cache_control.max_age is None:
+        etag = hashlib.sha256(body).hexdigest()[:32]
+
+    # Send the compressed body if the client accepts an encoding, cached by ETag, by URL for files that never change
+    # (such as Dash's versioned scripts), or else by a hash of the content
+    encoding = chooseEncoding(encodingSuffixes) if len(body) >= minimumSize else None
+    if encoding is not None:
+        key = etag or (request.full_path if response.cache_control.max_age is not None else hashlib.sha256(body).hexdigest())
+        response.set_data(getCompressedBody(key, body, encoding))
+        response.content_encoding = encoding
+    if etag is not None:
+        response.set_etag(getEncodedEtag(etag, encoding))
+    return response.make_conditional(request) if cacheable else response
+
+
+# Function to send a static file, or the compressed variant the pipeline made of it if the client accepts one
+def sendStaticFile(filename, folder=staticPath):
+    path = safe_join(str(folder), filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    path = Path(path)
+    stat = path.stat()
+    variants = getFileVariants(path) if path.suffix.lower() in compressibleSuffixes else {}
+    encoding = chooseEncoding(variants)
+
+    # The variant is sent with the type, ETag and modification time of the file it was made from, and 304 if the client has it
+    response = send_file(variants.get(encoding, path), mimetype=mimetypes.guess_type(path.name)[0],
+                         etag=getEncodedEtag(getContentEtag(str(path), stat.st_size, stat.st_mtime_ns), encoding),
+                         last_modified=stat.st_mtime)
+    if variants:
+        response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.content_encoding = encoding
+    return response
@@ -0,0 +1,356 @@
+# Importing modules
+from dash import dash, html, dash_table, dcc, Output, Input
+import pandas as pd
+import json
+import math
+import operator
+import numpy as np
+from functools import lru_cache
+from pathlib import Path
+import compression
+import dataStore
+import figures
+import metrics
+
+# Get the directory of the current script
+script_dir = Path(__file__).parent
+
+# Number of serialized figures kept for each graph
+figureCacheSize = 512
+
+# Function to get a pipeline output from the snapshot of the data currently served
+def getDataset(name, snapshot=None):
+    return dataStore.getPart(('dataset', name), snapshot)
+
+# Function to build lookup indexes of the cleaned data, so the graph callbacks do not have to scan the whole dataframe
+@dataStore.part('seriesIndexes')
+def loadSeriesIndexes(snapshot):
+    return figures.getSeriesIndexes(getDataset("cleanedData", snapshot))
+
+# Function to open the figures pre-rendered by the pipeline, None if they were not rendered from the current cleaned data
+@dataStore.part('figureBundle')
+def loadFigureBundle(snapshot):
+    return figures.loadFigureBundle(script_dir / "data/cleanedData.csv")
+
+# Function to create the cache of serialized line graphs for a snapshot, reusing figures for repeated selections
+@dataStore.part('lineFigures')
+def createLineFigureCache(snapshot):
+    @lru_cache(maxsize=figureCacheSize)
+    def getLineFigure(sex, sector, column):
+        # Use the pre-rendered figure, or draw it when it is not in the bundle
+        figure = figures.readFigure(dataStore.getPart('figureBundle', snapshot), 'line', sex, sector, column)
+        if figure is None:
+            series = dataStore.getPart('seriesIndexes', snapshot)[0].get(
+                (sex, sector), {name: [] for name in ['Year'] + figures.graphColumns})
+            figure = figures.createLineFigure(series, sex, sector, column)
+        return figure
+    return getLineFigure
+
+# Function to create the cache of serialized bar charts for a snapshot, reusing figures for repeated selections
+@dataStore.part('barFigures')
+def createBarFigureCache(snapshot):
+    @lru_cache(maxsize=figureCacheSize)
+    def getBarFigure(sex, year, column):
+        figure = figures.readFigure(dataStore.getPart('figureBundle', snapshot), 'bar', sex, year, column)
+        if figure is None:
+            series = dataStore.getPart('seriesIndexes', snapshot)[1].get(
+                (sex, year), {name: [] for name in ['NACE Rev 2 Sector'] + figures.graphColumns})
+            figure = figures.createBarFigure(series, sex, year, column)
+        return figure
+    return getBarFigure
+
+# Function to get the serialized line graph for a sex and sector from the data currently served
+def getLineFigure(sex, sector, column):
+    return dataStore.getPart('lineFigures')(sex, sector, column)
+
+# Function to get the serialized bar chart for a sex and year from the data currently served
+def getBarFigure(sex, year, column):
+    return dataStore.getPart('barFigures')(sex, year, column)
+
+# Function to create a Dash app served under a URL prefix by the dispatcher in app.py
+def createDashApp(prefix):
+    dashApp = dash.Dash(__name__, requests_pathname_prefix=prefix, routes_pathname_prefix="/")
+    
+    # Compress the layouts, figures and table pages, and answer conditional requests for unchanged ones with 304
+    dashApp.server.after_request(compression.encodeResponse)
+    return dashApp
+
+# Function to create the layout of the first Dash app from the cleaned data
+def createLineGraphLayout(df):
+    return html.Div([
+
+        # Title of the app
+        html.H1(children='Annual Earnings Estimates and Associated Annual Change by Sex and NACE Rev 2 Sector', style={'textAlign': 'center'}),
+
+        # Dropdown to filter by sex
+        html.Div([
+            dcc.Dropdown(
+                id='sex-dropdown',
+                options=[{'label': sex, 'value': sex} for sex in df['Sex'].unique()],
+                value='Both sexes'
+            ),
+        ]),
+
+        # Dropdown to filter by sector
+        html.Div([
+            dcc.Dropdown(
+                id='sector-dropdown',
+                options=[{'label': sector, 'value': sector} for sector in df['NACE Rev 2 Sector'].unique()],
+                value='Accommodation and food service activities (I)'
+            ),
+            # Radio Buttons to select the data points to be displayed
+             dcc.RadioItems(
+                options=['Median Annual Earnings (€)', 'Annual Change (%)'],
+                value='Median Annual Earnings (€)',
+                id='graph-controls'
+            ),       
+        ]),
+
+        dcc.Graph(id='graph-content')
+    ])
+
+# Function to create the first Dash app, a line graph by sex and sector
+def createLineGraphApp(prefix):
+    dashApp = createDashApp(prefix)
+    
+    # Define the layout of the first Dash app, built for each page load so the dropdowns show the data currently served
+    dashApp.layout = lambda: createLineGraphLayout(getDataset("cleanedData"))
+    
+    # Define the callback function to update the graph based on the selected filters
+    @dashApp.callback(
+        Output('graph-content', 'figure'),
+        Input('sex-dropdown', 'value'),
+        Input('sector-dropdown', 'value'),
+        Input('graph-controls', 'value')
+    )
+    @metrics.timed('dash_callback_duration_seconds', callback='updateGraph1')
+    def updateGraph1(sex, sector, column):
+        # Return the line graph of the selected data
+        return json.loads(getLineFigure(sex, sector, column))
+    
+    return dashApp
+
+# Function to create the layout of the second Dash app from the cleaned data
+def createBarChartLayout(df):
+    return html.Div([
+
+        # Title of the app
+        html.H1(children='Annual Earnings Estimates and Associated Annual Change by Sex and NACE Rev 2 Sector', style={'textAlign': 'center'}),
+
+        # Dropdown to filter by year
+        html.Div([
+            dcc.Dropdown(
+                id='year-dropdown',
+                options=[{'label': str(year), 'value': str(year)} for year in df['Year'].unique()],
+                value='2023'
+            ),
+        ]),
+
+        # Dropdown to filter by sex
+        html.Div([
+            dcc.Dropdown(
+                id='sex-dropdown',
+                options=[{'label': sex, 'value': sex} for sex in df['Sex'].unique()],
+                value='Both sexes'
+            ),
+            # Radio Buttons to select the data points to be displayed
+            dcc.RadioItems(
+                options=['Median Annual Earnings (€)', 'Annual Change (%)'],
+                value='Median Annual Earnings (€)',
+                id='graph-controls'
+            ),
+        ]),
+
+        dcc.Graph(id='graph-content', style={'height': '700px', 'width': '100%'})
+    ])
+
+# Function to create the second Dash app, a bar chart by sex and year
+def createBarChartApp(prefix):
+    dashApp = createDashApp(prefix)
+    
+    # Define the layout of the second Dash app, built for each page load so the dropdowns show the data currently served
+    dashApp.layout = lambda: createBarChartLayout(getDataset("cleanedData"))
+    
+    # Define the callback function to update the graph based on the selected filters
+    @dashApp.callback(
+        Output('graph-content', 'figure'),
+        Input('sex-dropdown', 'value'),
+        Input('year-dropdown', 'value'),
+        Input('graph-controls', 'value')
+    )
+    # Function to update the graph based on the selected filters
+    @metrics.timed('dash_callback_duration_seconds', callback='updateGraph2')
+    def updateGraph2(sex, year, column):
+        # Return the bar chart of the selected data
+        return json.loads(getBarFigure(sex, int(year), column))
+    
+    return dashApp
+
+# Comparison operators that can be used in the DataTable filter boxes
+filterOperators = {
+    'ge': operator.ge, 'le': operator.le, 'lt': operator.lt,
+    'gt': operator.gt, 'ne': operator.ne, 'eq': operator.eq,
+}
+
+# Operators as they appear in a DataTable filter query, checked in this order
+# Each can be prefixed by "s" or "i" for a case sensitive or insensitive comparison, e.g. "s>=" or "icontains"
+filterOperatorNames = [['ge ', '>='], ['le ', '<='], ['lt ', '<'], ['gt ', '>'], ['ne ', '!='], ['eq ', '='], ['contains '], ['datestartswith ']]
+
+# Function to build an index over a table dataset, the sort orders and text copies are added the first time they are used
+def createTableIndex(frame):
+    return {'frame': frame, 'orders': {}, 'text': {}}
+
+# Function to build the index of a table dataset for a snapshot of the app's data
+@dataStore.part('tableIndex')
+def loadTableIndex(snapshot, name):
+    return createTableIndex(getDataset(name, snapshot))
+
+# Function to get the row order for sorting a table by a column, working it out once per column and direction
+def getTableOrder(index, column, direction):
+    order = index['orders'].get((column, direction))
+    if order is None and column in index['frame'].columns:
+        values = index['frame'][column]
+        order = values.sort_values(ascending=direction == 'asc', kind='stable', na_position='last').index.to_numpy()
+        # Row numbers fit in 32 bits, which halves the memory each order takes
+        order = order.astype(np.int32) if len(order) < np.iinfo(np.int32).max else order
+        index['orders'][(column, direction)] = order
+    return order
+
+# Function to test the lower case text of every value of a column, returning a boolean array
+def getTextMask(index, column, test):
+    values = index['frame'][column]
+    
+    # For categorical columns only each category is tested, with missing values shown as 'nan' like the text copy
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = pd.Series([str(category).lower() for category in values.cat.categories] + ['nan'])
+        return np.asarray(test(categories), dtype=bool)[values.cat.codes.to_numpy()]
+    
+    # Keep a lower case text copy of other columns once they have been filtered as text
+    text = index['text'].get(column)
+    if text is None:
+        text = values.astype(str).str.lower()
+        index['text'][column] = text
+    return np.asarray(test(text), dtype=bool)
+
+# Function to split one part of a DataTable filter query into the column, operator and value
+def splitFilterPart(filterPart):
+    # Read the {column} first, so the operator is only looked for straight after it and not in the column name or value
+    filterPart = filterPart.strip()
+    if not filterPart.startswith('{') or '}' not in filterPart:
+        return None, None, None
+    name, operatorPart = filterPart[1:].split('}', 1)
+    operatorPart = operatorPart.lstrip()
+    for operatorNames in filterOperatorNames:
+        for operatorName in [prefix + operatorName for operatorName in operatorNames for prefix in ('', 's', 'i')]:
+            if operatorPart.startswith(operatorName):
+                valuePart = operatorPart[len(operatorName):].strip()
+                # Remove quotes from text values, otherwise try to read the value as a number for the comparison
+                # operators, while contains and datestartswith keep the text as typed so 2015 does not become "2015.0"
+                if len(valuePart) > 1 and valuePart[0] == valuePart[-1] and valuePart[0] in ("'", '"', '`'):
+                    value = valuePart[1:-1].replace('\\' + valuePart[0], valuePart[0])
+                elif operatorNames[0].strip() not in filterOperators:
+                    value = valuePart
+                else:
+                    try:
+                        value = float(valuePart)
+                    except ValueError:
+                        value = valuePart
+                return name, operatorNames[0].strip(), value
+    return None, None, None
+
+# Function to get which rows of a table match a DataTable filter query
+def getFilterMask(index, filterQuery):
+    frame = index['frame']
+    mask = np.ones(len(frame), dtype=bool)
+    for filterPart in filterQuery.split(' && '):
+        column, operatorName, value = splitFilterPart(filterPart)
+        if column not in frame.columns:
+            continue
+        # Compare numbers with numbers, and everything else as lower case text
+        if operatorName in filterOperators and isinstance(value, float) and pd.api.types.is_numeric_dtype(frame[column]):
+            # Compare in double precision, as a float32 column would otherwise round the value being compared with
+            mask &= filterOperators[operatorName](frame[column].to_numpy(dtype='float64'), value)
+        elif operatorName in filterOperators:
+            mask &= getTextMask(index, column, lambda text: filterOperators[operatorName](text, str(value).lower()))
+        elif operatorName == 'contains':
+            mask &= getTextMask(index, column, lambda text: text.str.contains(str(value).lower(), regex=False))
+        elif operatorName == 'datestartswith':
+            mask &= getTextMask(index, column, lambda text: text.str.startswith(str(value).lower()))
+    return mask
+
+# Function to get one page of a table after sorting and filtering it, along with the number of pages
+def getTablePage(index, page, pageSize, sortBy, filterQuery):
+    frame = index['frame']
+    
+    # Use the precomputed order for the sorted column, or the original order
+    order = None
+    if sortBy:
+        order = getTableOrder(index, sortBy[0]['column_id'], sortBy[0]['direction'])
+    if not sortBy or order is None:
+        order = np.arange(len(frame))
+    
+    # Keep only the rows that match the filter
+    if filterQuery:
+        order = order[getFilterMask(index, filterQuery)[order]]
+    
+    # Return only the rows on the requested page
+    rows = order[page * pageSize:(page + 1) * pageSize]
+    return frame.iloc[rows].to_dict('records'), max(1, math.ceil(len(order) / pageSize))
+
+# Function to create a DataTable that is paged, sorted and filtered on the server
+def createDataTable(frame, pageSize):
+    return dash_table.DataTable(
+        id='table',
+        columns=[{"name": i, "id": i} for i in frame.columns],
+        data=[],
+        page_current=0,
+        page_size=pageSize,
+        page_count=max(1, math.ceil(len(frame) / pageSize)),
+        page_action='custom',
+        sort_action='custom',
+        sort_mode='single',
+        sort_by=[],
+        filter_action='custom',
+        filter_query='',
+        style_table={'overflowX': 'auto'},
+        style_cell={'textAlign': 'left', 'padding': '8px'},
+        style_header={'backgroundColor': 'lightgrey', 'fontWeight': 'bold'}
+    )
+
+# Function to add the callback that sends the visible page of a table to the browser
+def addTableCallback(dashApp, datasetName):
+    @dashApp.callback(
+        Output('table', 'data'),
+        Output('table', 'page_count'),
+        Input('table', 'page_current'),
+        Input('table', 'page_size'),
+        Input('table', 'sort_by'),
+        Input('table', 'filter_query')
+    )
+    @metrics.timed('dash_callback_duration_seconds', callback=f"updateTable {dashApp.config.requests_pathname_prefix}")
+    def updateTable(page, pageSize, sortBy, filterQuery):
+        return getTablePage(dataStore.getPart(('tableIndex', datasetName)), page, pageSize, sortBy, filterQuery)
+
+# Function to create a Dash app showing one of the pipeline outputs as a table
+def createTableApp(prefix, title, datasetName, pageSize):
+    dashApp = createDashApp(prefix)
+    
+    # Define the layout with the title and a table of the dataset, built for each page load from the data currently served
+    dashApp.layout = lambda: html.Div([
+        html.H2(title),
+        createDataTable(getDataset(datasetName), pageSize)
+    ])
+    
+    # Send only the visible page of the table, sorted and filtered on the server
+    addTableCallback(dashApp, datasetName)
+    return dashApp
+
+# Functions to create each Dash app, keyed by the URL prefix it is served under
+dashAppBuilders = {
+    '/dash1': createLineGraphApp,
+    '/dash2': createBarChartApp,
+    '/dash3': lambda prefix: createTableApp(prefix, "Gender Pay Gap By NACE Rev 2 Sector", "genderPayGap", 13),
+    '/dash4': lambda prefix: createTableApp(prefix, "Sector Summary", "sectorSummary", 14),
+    '/dash5': lambda prefix: createTableApp(prefix, "Sex Summary", "sexSummary", 3),
+    '/dash6': lambda prefix: createTableApp(prefix, "Year Summary", "yearSummary", 14),
+}
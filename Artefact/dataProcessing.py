@@ -1,8 +1,24 @@
 # Importing modules
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 import pygal
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import argparse
+import hashlib
+import json
+import os
 import sys
+import time
+from columnStore import saveColumns, readData
+from earningsCube import buildCube, saveCube, earningsCubePath
+from payGap import getPayGapStatistics
+from figures import saveFigureBundle
+from staticCompression import compressStaticFiles
+import metrics
 
 # Get the directory of the current script
 script_dir = Path(__file__).parent
@@ -15,6 +31,32 @@ sectorSummaryPath = script_dir / "data/sectorSummary.csv"
 sexSummaryPath = script_dir / "data/sexSummary.csv"
 yearSummaryPath = script_dir / "data/yearSummary.csv"
 
+# Path to the file that records the state of the last run, used by the incremental mode
+pipelineStatePath = script_dir / "data/pipelineState.json"
+
+# Path to the file that records a hash of the content of each saved graph
+graphHashesPath = script_dir / "data/graphHashes.json"
+
+# Path to the report of how long each stage of the last run took
+pipelineTimingsPath = script_dir / "data/pipelineTimings.json"
+
+# Path to the file that records when the outputs were last published, watched by the app to reload its data
+releasePath = script_dir / "data/release.json"
+
+# Time taken by each stage of the current run
+stageTimings = []
+
+# Context manager to time a stage of the pipeline for the timing report
+@contextmanager
+def timeStage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stageTimings.append({'stage': stage, 'seconds': round(seconds, 6)})
+        metrics.observe('pipeline_stage_duration_seconds', {'stage': stage}, seconds)
+
 
 expectedTypes = {
     'Statistic Label': 'object',
@@ -26,76 +68,128 @@ expectedTypes = {
     'VALUE': 'float64',
 }
 
-# Cleaning data function
-def cleanData(df):
+# Label of the rows that hold the annual change values
+annualChangeLabel = "Annual Change (Median Annual Earnings)"
+
+# Columns that identify a single observation, used to match earnings to their annual change
+keyColumns = ['Year', 'Sex', 'NACE Rev 2 Sector', 'Age Group']
+
+# Columns of the cleaned data, which does not keep the age group as the extract only has one
+cleanedColumns = ['Year', 'Sex', 'NACE Rev 2 Sector', 'Median Annual Earnings (€)', 'Annual Change (%)']
+
+# Text columns that are stored as categories once they have been checked
+categoryColumns = ['Sex', 'NACE Rev 2 Sector', 'Age Group']
+
+# Number of rows read from the source CSV file at a time
+sourceChunkSize = 100000
+
+# Function to check a dataframe (or a chunk of one) for incorrect data types and missing values
+def checkData(df):
     # Check for incorrect data types
     for column, expectedType in expectedTypes.items():
         if df[column].dtype != expectedType:
             print(f"Error: Column '{column}' has incorrect data type. Expected {expectedType}, but got {df[column].dtype}.")
             sys.exit(1)
-    # Check for missing values
-    filteredDf = df[df["Statistic Label"] != "Annual Change (Median Annual Earnings)"]
-    if filteredDf.isnull().values.any():
+    # Check for missing values, annual change rows are allowed to be missing for the first year
+    if df[df["Statistic Label"] != annualChangeLabel].isnull().values.any():
         print("Error: There are missing values in the dataset.")
         sys.exit(1)
-    else:
-        # Create a new column for the annual change values
-        df["Annual Change (%)"] = pd.Series(df[df["Statistic Label"] == "Annual Change (Median Annual Earnings)"]["VALUE"].values)
+
+# Function to match each earnings value to its annual change value using the key columns
+def joinAnnualChange(df):
+    isAnnualChange = df["Statistic Label"] == annualChangeLabel
+    earnings = df.loc[~isAnnualChange, keyColumns + ["VALUE"]]
+    annualChange = df.loc[isAnnualChange, keyColumns + ["VALUE"]]
     
-        # Drop redundant rows
-        df = df.drop(df[df["Statistic Label"] == "Annual Change (Median Annual Earnings)"].index)
+    # Check that no observation appears more than once, otherwise the join would duplicate rows
+    if earnings.duplicated(keyColumns).any() or annualChange.duplicated(keyColumns).any():
+        print("Error: There are duplicate observations in the dataset.")
+        sys.exit(1)
+    
+    # Join the annual change values onto the earnings rows, sorted by the key columns so the outputs, the years in
+    # each graph and the dropdown options do not depend on the order of the rows in the source file
+    annualChange = annualChange.rename(columns={"VALUE": "Annual Change (%)"})
+    df = earnings.merge(annualChange, on=keyColumns, how='left').sort_values(keyColumns, ignore_index=True)
     
-        # Rename the value column
-        df = df.rename(columns={"VALUE": "Median Annual Earnings (€)"})
+    # Rename the value column
+    df = df.rename(columns={"VALUE": "Median Annual Earnings (€)"})
     
-        # Reorder columns
-        df = df[['Year', 'Sex', 'NACE Rev 2 Sector', 'Age Group', 'Median Annual Earnings (€)', 'UNIT', 'Annual Change (%)']]
+    # Reorder columns, keeping the age group for the earnings cube
+    return df[keyColumns + ['Median Annual Earnings (€)', 'Annual Change (%)']]
+
+# Cleaning data function
+def cleanData(df):
+    # Check for incorrect data types and missing values
+    checkData(df)
+    # Return cleaned data, dropping the unused age group column
+    return joinAnnualChange(df)[cleanedColumns]
+
+# Function to read and check the source CSV file in chunks, returning every observation with its age group
+def readObservations(path, chunkSize=sourceChunkSize):
+    chunks = []
+    for chunk in pd.read_csv(path, chunksize=chunkSize):
+        # A chunk without any missing values is read as integers, so convert it to match the full file
+        if pd.api.types.is_integer_dtype(chunk["VALUE"]):
+            chunk["VALUE"] = chunk["VALUE"].astype('float64')
+        checkData(chunk)
+        
+        # Only keep the columns that are needed, with the text columns stored as categories
+        chunk = chunk[["Statistic Label"] + keyColumns + ["VALUE"]]
+        chunks.append(chunk.astype({column: 'category' for column in ["Statistic Label"] + categoryColumns}))
     
-        # Drop redundant/unused columns
-        df = df.drop(columns=["UNIT", "Age Group"])
+    # Combine the chunks, merging the categories of each chunk
+    data = {}
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            data[column] = union_categoricals([chunk[column] for chunk in chunks], sort_categories=True)
+        else:
+            data[column] = np.concatenate([chunk[column].to_numpy() for chunk in chunks])
     
-        # Return cleaned data
-        return df
+    # Return the observations with their annual change
+    return joinAnnualChange(pd.DataFrame(data))
+
+# Function to read, check and clean the source CSV file in chunks so large extracts are never held as text
+def readSourceData(path, chunkSize=sourceChunkSize):
+    # Return cleaned data, dropping the unused age group column
+    return readObservations(path, chunkSize)[cleanedColumns]
+
 
+# Value columns that are summarised, with the names used for them in the summary columns
+summaryColumns = {
+    'Median Annual Earnings (€)': 'Annual Earnings',
+    'Annual Change (%)': 'Annual Change',
+}
+
+# Statistics calculated for each value column by default
+summaryStatistics = ['mean', 'median', 'max', 'min']
 
 # Get summary statistics function
-def getSummary(df, groupByColumn):
+def getSummary(df, groupByColumns, statistics=summaryStatistics):
     
-    # Group data by the specified column
-    groups = {group: data for group, data in df.groupby(groupByColumn)}
+    # Allow a single column name or a list of columns, such as ['Year', 'Sex']
+    if isinstance(groupByColumns, str):
+        groupByColumns = [groupByColumns]
     
-    # Initialize a list to store the results
-    results = []
+    # Calculate every statistic for every group in a single grouped aggregation
+    summary = df.groupby(list(groupByColumns), observed=True)[list(summaryColumns)].agg(statistics).round(2)
     
-    # Iterate over each group to calculate summary statistics for mean, median, max and min values
-    for name, group in groups.items():
-        meanValues = group.mean(numeric_only=True).round(2)
-        medianValues = group.median(numeric_only=True).round(2)
-        maxValue = group.max(numeric_only=True).round(2)
-        minValue = group.min(numeric_only=True).round(2)
-        
-        # Create a dictionary with the summary statistics for the current group
-        result = {
-            groupByColumn: name,
-            'Mean Annual Earnings': meanValues.get('Median Annual Earnings (€)', None),
-            'Median Annual Earnings': medianValues.get('Median Annual Earnings (€)', None),
-            'Max Annual Earnings': maxValue.get('Median Annual Earnings (€)', None),
-            'Min Annual Earnings': minValue.get('Median Annual Earnings (€)', None),
-            'Mean Annual Change': meanValues.get('Annual Change (%)', None),
-            'Median Annual Change': medianValues.get('Annual Change (%)', None),
-            'Max Annual Change': maxValue.get('Annual Change (%)', None),
-            'Min Annual Change': minValue.get('Annual Change (%)', None),
-        }
-        # Append the result to the results list
-        results.append(result)
-    
-    # Create a dataframe from the results list
-    summary = pd.DataFrame(results)
-    
-    # Return the summary statistics and the grouped data
-    return summary, groups
-
-def createGraph(data, title, years):
+    # Name the columns after the statistic and value, e.g. 'Mean Annual Earnings'
+    summary.columns = [f"{statistic.title()} {summaryColumns[column]}" for column, statistic in summary.columns]
+    
+    # Return the summary statistics with the group columns first
+    return summary.reset_index()
+
+# Function to get the earnings series for each sector from a single pivot of the data
+def getGraphSeries(data, years):
+    
+    # Pivot the data to one row per sector and one column per year, keeping the order the sectors appear in
+    pivot = data.pivot_table(index='NACE Rev 2 Sector', columns='Year', values='Median Annual Earnings (€)', aggfunc='mean', observed=True)
+    pivot = pivot.reindex(index=data['NACE Rev 2 Sector'].drop_duplicates().tolist(), columns=years)
+    
+    # Return each sector with its earnings for every year, using None for years without data
+    return [(str(sector), [None if pd.isna(e) else float(e) for e in row]) for sector, row in zip(pivot.index, pivot.to_numpy())]
+
+def createGraph(series, title, years):
     
     # Create a line graph using pygal
     lineGraph = pygal.Line()
@@ -107,14 +201,7 @@ def createGraph(data, title, years):
     lineGraph.x_labels = years
     
     # Add data for each sector
-    for sector in data['NACE Rev 2 Sector'].unique():
-        currentSector = data[data['NACE Rev 2 Sector'] == sector]
-        currentEarnings = [
-            currentSector[currentSector['Year'] == year]['Median Annual Earnings (€)'].mean()
-            if year in currentSector['Year'].values
-            else None
-            for year in years
-        ]
+    for sector, currentEarnings in series:
         
         # Add the data to the graph and include labels for the values with the euro symbol
         lineGraph.add(sector, [{"value": e, "label": f" €{e:.2f}"} if e else None for e in currentEarnings])
@@ -122,82 +209,273 @@ def createGraph(data, title, years):
     # Render the graph as a unicode string
     return lineGraph.render(is_unicode=True)
 
-# Function to create and save graphs
-def saveGraphs(both, female, male, years):
-
-    # Use the createGraph function to create graphs for each sex
-    bothGraph = createGraph(both, "Median Annual Earnings by Sector Over Time (Both Sexes)", years)
-    maleGraph = createGraph(male, "Median Annual Earnings by Sector Over Time (Male Only)", years)
-    femaleGraph = createGraph(female, "Median Annual Earnings by Sector Over Time (Female Only)", years)
-    
-    # Save graphs to files in the static folder
-    with open(script_dir / "static/bothGraph.svg", "w", encoding="utf-8") as f:
-        f.write(bothGraph)
-    with open(script_dir / "static/maleGraph.svg", "w", encoding="utf-8") as f:
-        f.write(maleGraph)
-    with open(script_dir / "static/femaleGraph.svg", "w", encoding="utf-8") as f:
-        f.write(femaleGraph)
+# Function to render a graph in a worker process
+def renderGraph(job):
+    series, title, years = job
+    return createGraph(series, title, years)
 
+# Graphs saved by saveGraphs, as the sex shown, the graph title and the file name in the static folder
+graphs = [
+    ('Both sexes', "Median Annual Earnings by Sector Over Time (Both Sexes)", "bothGraph.svg"),
+    ('Male', "Median Annual Earnings by Sector Over Time (Male Only)", "maleGraph.svg"),
+    ('Female', "Median Annual Earnings by Sector Over Time (Female Only)", "femaleGraph.svg"),
+]
 
-
-# Function to generate a new dataframe with gender pay gap statistics
-def gpgStatistics(male, female):
-    
-    # Merge the male and female dataframes
-    genderPayGap = male.merge(female, on=['Year', 'NACE Rev 2 Sector'], suffixes=('_Male', '_Female'))
+# Function to create and save graphs, optionally only for some of the sexes
+def saveGraphs(df, years, sexes=None, graphList=graphs):
     
-    # Calculate the difference in earnings
-    genderPayGap['Difference in Earnings (€)'] = genderPayGap['Median Annual Earnings (€)_Male'] - genderPayGap['Median Annual Earnings (€)_Female']
+    # Load the hashes of the graphs that were last saved
+    graphHashes = {}
+    if graphHashesPath.exists():
+        with open(graphHashesPath, encoding="utf-8") as f:
+            graphHashes = json.load(f)
     
-    # Calculate the difference in annual change
-    genderPayGap['Difference in Annual Change (%)'] = (genderPayGap['Annual Change (%)_Male'] - genderPayGap['Annual Change (%)_Female']).round(1)
-    
-    # Calculate the gender paygap as the difference in earnings as a percentage
-    genderPayGap['Gender Pay Gap (%)'] = ((genderPayGap['Difference in Earnings (€)'] / genderPayGap['Median Annual Earnings (€)_Male']) * 100).round(2)
+    # Build the series for each graph and work out which graphs have changed
+    jobs = []
+    for sex, title, fileName in graphList:
+        if sexes is not None and sex not in sexes:
+            continue
+        series = getGraphSeries(df[df['Sex'] == sex], years)
+        
+        # The rendered SVG contains a random id, so the hash is taken from everything that is drawn instead
+        content = json.dumps([title, years, series, pygal.__version__])
+        contentHash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        if graphHashes.get(fileName) == contentHash and (script_dir / "static" / fileName).exists():
+            continue
+        jobs.append((fileName, contentHash, (series, title, years)))
+    if not jobs:
+        return
     
-    # Sort the data by sector and year
-    genderPayGap = genderPayGap.sort_values(by=['NACE Rev 2 Sector', 'Year'])
+    # Render the graphs in parallel, one worker process per graph
+    if len(jobs) == 1:
+        rendered = [renderGraph(jobs[0][2])]
+    else:
+        with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+            rendered = list(pool.map(renderGraph, [job for _, _, job in jobs]))
     
-    # Calculate the change in gender paygap between years for each sector
-    genderPayGap['Change in Gender Pay Gap (%)'] = genderPayGap.groupby('NACE Rev 2 Sector')['Gender Pay Gap (%)'].diff().round(2)
+    # Save the graphs to files in the static folder and record their hashes
+    for (fileName, contentHash, _), graph in zip(jobs, rendered):
+        with open(script_dir / "static" / fileName, "w", encoding="utf-8") as f:
+            f.write(graph)
+        graphHashes[fileName] = contentHash
+    with open(graphHashesPath, "w", encoding="utf-8") as f:
+        json.dump(graphHashes, f, indent=4)
+
+
+# Function to generate a new dataframe with gender pay gap statistics
+def gpgStatistics(male, female):
     
-    # Reorder columns and dropping redundant columns and return the dataframe
-    genderPayGap = genderPayGap[['Year', 'NACE Rev 2 Sector', 'Difference in Earnings (€)', 'Difference in Annual Change (%)', 'Gender Pay Gap (%)', 'Change in Gender Pay Gap (%)']]
-    return genderPayGap
+    # Align the male and female earnings as arrays by sector and year, then calculate the difference in earnings,
+    # the difference in annual change, the gender pay gap and its change between years for every cell at once
+    return getPayGapStatistics(male, female)
 
 # Function to analyse the data and generate summary statistics and graphs
 def analyseData(df):
     # Get summary statistics
-    sectorSummary, sectors = getSummary(df, 'NACE Rev 2 Sector')
-    sexSummary, sexes = getSummary(df, 'Sex')
-    yearSummary, years = getSummary(df, 'Year')
+    with timeStage("getSummary (NACE Rev 2 Sector)"):
+        sectorSummary = getSummary(df, 'NACE Rev 2 Sector')
+    with timeStage("getSummary (Sex)"):
+        sexSummary = getSummary(df, 'Sex')
+    with timeStage("getSummary (Year)"):
+        yearSummary = getSummary(df, 'Year')
     #Creating new dataframes for each sex
-    male = sexes["Male"].drop(columns="Sex")
-    female = sexes["Female"].drop(columns="Sex")
+    male = df[df['Sex'] == 'Male'].drop(columns="Sex")
+    female = df[df['Sex'] == 'Female'].drop(columns="Sex")
     # Save graphs
-    saveGraphs(sexes['Both sexes'], sexes['Female'], sexes['Male'], list(years.keys()))
+    with timeStage("saveGraphs"):
+        saveGraphs(df, yearSummary['Year'].tolist())
     # Calculate gender pay gap statistics
-    genderPayGap = gpgStatistics(male, female)
+    with timeStage("gpgStatistics"):
+        genderPayGap = gpgStatistics(male, female)
     # Return summaries and gender pay gap statistics
     return sectorSummary, sexSummary, yearSummary, male, female, genderPayGap
 
 
 
-if __name__ == '__main__':
-    # Read the source data CSV file
-    df = pd.read_csv(sourceDataPath)
+# Function to save an output to a CSV file and a columnar copy for the app to load quickly
+def saveOutput(df, path):
+    # Write the CSV to a temporary file and swap it in, so the app never reads a half written file
+    temporaryPath = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    df.to_csv(temporaryPath, index=False, header=True)
+    os.replace(temporaryPath, path)
+    saveColumns(df, path)
+
+# Function to get a fingerprint of a file from its contents
+def getFingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to load the state of the last run, or an empty state if there has not been one
+def loadState():
+    if not pipelineStatePath.exists():
+        return {}
+    with open(pipelineStatePath, encoding="utf-8") as f:
+        return json.load(f)
+
+# Function to save the state of the current run
+def saveState(state):
+    with open(pipelineStatePath, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=4)
+
+# Function to tell a running app that new outputs have been published, written last so the app never loads half of a run
+def publishRelease(fingerprint, mode):
+    temporaryPath = releasePath.with_name(f"{releasePath.name}.{os.getpid()}.tmp")
+    with open(temporaryPath, "w", encoding="utf-8") as f:
+        json.dump({'time': datetime.now(timezone.utc).isoformat(), 'source': fingerprint, 'mode': mode}, f, indent=4)
+    os.replace(temporaryPath, releasePath)
+
+# Function to convert categorical columns back to plain values so outputs from different runs can be combined
+def asPlain(df):
+    return df.astype({column: object for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)})
+
+# Function to find the observations that were added, removed or changed since the previous run
+def findChanges(previous, current):
+    keys = ['Year', 'Sex', 'NACE Rev 2 Sector']
+    merged = asPlain(previous).merge(asPlain(current), on=keys, how='outer', suffixes=('_Old', '_New'), indicator=True)
+    
+    # An observation has changed if it is only in one of the runs or any of its values differ
+    changed = merged['_merge'] != 'both'
+    for column in summaryColumns:
+        old, new = merged[f"{column}_Old"], merged[f"{column}_New"]
+        changed |= (old != new) & ~(old.isna() & new.isna())
+    return merged.loc[changed, keys]
+
+# Function to replace the rows of a previous output for the keys that were recalculated
+def updateRows(previous, updated, keyColumns, changedKeys):
+    previous, updated = asPlain(previous), asPlain(updated)
+    
+    # Keep the previous rows that were not recalculated, rows for removed keys are dropped with them
+    keep = ~pd.MultiIndex.from_frame(previous[keyColumns]).isin(changedKeys)
+    return pd.concat([previous[keep], updated]).sort_values(keyColumns, ignore_index=True)
+
+# Function to run the full pipeline, rebuilding every output
+def runFull():
+    # Read and clean the source data CSV file in chunks
+    with timeStage("readSourceData"):
+        observations = readObservations(sourceDataPath)
+        df = observations[cleanedColumns]
+    
+    # Build the earnings cube used by the earnings API
+    with timeStage("buildCube"):
+        saveCube(buildCube(observations), earningsCubePath)
     
-    # Clean the data
-    df = cleanData(df)
+    # Save the cleaned data
+    with timeStage("saveOutput (cleanedData)"):
+        saveOutput(df, cleanedDataPath)
     
-    # Save the cleaned data to a CSV file
-    df.to_csv(cleanedDataPath, index=None, header=True)
+    # Pre-render the Dash graphs from the saved copy of the cleaned data, which is what the app loads
+    with timeStage("saveFigureBundle"):
+        saveFigureBundle(readData(cleanedDataPath), cleanedDataPath)
     
     # Analyse the data and save graphs
     sectorSummary, sexSummary, yearSummary, male, female, genderPayGap = analyseData(df)
 
-    # Save the summaries and gender pay gap statistics to CSV files
-    sectorSummary.to_csv(sectorSummaryPath, index=False, header=True)
-    sexSummary.to_csv(sexSummaryPath, index=False, header=True)
-    yearSummary.to_csv(yearSummaryPath, index=False, header=True)
-    genderPayGap.to_csv(genderPayGapPath, index=False, header=True)
\ No newline at end of file
+    # Save the summaries and gender pay gap statistics
+    with timeStage("saveOutput (summaries and gender pay gap)"):
+        saveOutput(sectorSummary, sectorSummaryPath)
+        saveOutput(sexSummary, sexSummaryPath)
+        saveOutput(yearSummary, yearSummaryPath)
+        saveOutput(genderPayGap, genderPayGapPath)
+
+# Function to update only the outputs whose inputs changed since the last run
+def runIncremental():
+    # Without the previous outputs there is nothing to update, so rebuild everything
+    summaryPaths = {'NACE Rev 2 Sector': sectorSummaryPath, 'Sex': sexSummaryPath, 'Year': yearSummaryPath}
+    if not all(path.exists() for path in [cleanedDataPath, genderPayGapPath, *summaryPaths.values()]):
+        print("No previous outputs found, running the full pipeline.")
+        runFull()
+        return
+    
+    # Compare the newly cleaned data with the cleaned data from the last run
+    previous = readData(cleanedDataPath)
+    with timeStage("readSourceData"):
+        observations = readObservations(sourceDataPath)
+        df = observations[cleanedColumns]
+    with timeStage("findChanges"):
+        changes = findChanges(previous, df)
+    if changes.empty:
+        print("No observations have changed.")
+        return
+    saveOutput(df, cleanedDataPath)
+    
+    # Pre-render the Dash graphs, only the figures whose data changed are drawn again
+    with timeStage("saveFigureBundle"):
+        rendered, total = saveFigureBundle(readData(cleanedDataPath), cleanedDataPath)
+    print(f"Rendered {rendered} of {total} Dash figures.")
+    
+    # The cube holds every roll-up, so it is rebuilt as a whole, which only takes a fraction of a second
+    with timeStage("buildCube"):
+        saveCube(buildCube(observations), earningsCubePath)
+    
+    # Recalculate the summary rows only for the groups that changed
+    for column, path in summaryPaths.items():
+        changedGroups = changes[[column]].drop_duplicates()
+        with timeStage(f"getSummary ({column})"):
+            updated = getSummary(df[df[column].isin(changedGroups[column])], column)
+            saveOutput(updateRows(readData(path), updated, [column], pd.MultiIndex.from_frame(changedGroups)), path)
+        print(f"Updated {len(changedGroups)} {column} summary rows.")
+    
+    # Recalculate the gender pay gap if male or female earnings changed, which is quick as it works on aligned arrays
+    changedPairs = changes.loc[changes['Sex'].isin(['Male', 'Female']), ['Year', 'NACE Rev 2 Sector']].drop_duplicates()
+    if not changedPairs.empty:
+        with timeStage("gpgStatistics"):
+            male = df[df['Sex'] == 'Male'].drop(columns="Sex")
+            female = df[df['Sex'] == 'Female'].drop(columns="Sex")
+            saveOutput(gpgStatistics(male, female), genderPayGapPath)
+        print(f"Updated {len(changedPairs)} gender pay gap rows.")
+    
+    # Every graph shows every year, so all graphs are redrawn if the years changed, otherwise only the changed sexes
+    years = sorted(df['Year'].unique().tolist())
+    if set(years) != set(previous['Year'].unique().tolist()):
+        sexes = None
+    else:
+        sexes = set(changes['Sex'])
+    with timeStage("saveGraphs"):
+        saveGraphs(df, years, sexes)
+    print(f"Redrew graphs for {'all sexes' if sexes is None else ', '.join(sorted(sexes))}.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Clean and analyse the CSO earnings data.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only update the outputs affected by changes to the source data since the last run")
+    args = parser.parse_args()
+    
+    runStart = time.perf_counter()
+    
+    # Skip the run entirely if the source data has not changed since the last run
+    state = loadState()
+    fingerprint = getFingerprint(sourceDataPath)
+    upToDate = args.incremental and state.get('source') == fingerprint and cleanedDataPath.exists()
+    if upToDate:
+        print("Outputs are already up to date.")
+    else:
+        if args.incremental:
+            runIncremental()
+        else:
+            runFull()
+        
+        # Record the source data the outputs were built from
+        state['source'] = fingerprint
+        saveState(state)
+    
+    # Save compressed copies of the graphs and other static files that changed, for clients that accept them
+    with timeStage("compressStaticFiles"):
+        print(f"Compressed {compressStaticFiles()} static files.")
+    
+    # Tell a running app about the new outputs, once everything it serves has been saved
+    if not upToDate:
+        publishRelease(fingerprint, "incremental" if args.incremental else "full")
+    
+    # Write a report of how long each stage took
+    with open(pipelineTimingsPath, "w", encoding="utf-8") as f:
+        json.dump({
+            'time': datetime.now(timezone.utc).isoformat(),
+            'mode': "incremental" if args.incremental else "full",
+            'totalSeconds': round(time.perf_counter() - runStart, 6),
+            'stages': stageTimings,
+        }, f, indent=4)
+    print(f"Finished in {time.perf_counter() - runStart:.2f}s, stage timings saved to {pipelineTimingsPath.name}")
@@ -0,0 +1,141 @@
+# Importing modules
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Get the directory of the current script
+script_dir = Path(__file__).parent
+
+# File the pipeline writes once all of its outputs have been published
+releasePath = script_dir / "data/release.json"
+
+# Pipeline outputs loaded by the app
+datasetNames = ['cleanedData', 'genderPayGap', 'sectorSummary', 'sexSummary', 'yearSummary']
+
+# Seconds between checks for a new release of the pipeline outputs, 0 turns the checks off
+reloadInterval = float(os.environ.get('DATA_RELOAD_INTERVAL', 10))
+
+# Sector whose gender pay gap is shown as the headline figure on the recommendations page
+headlineSector = "All NACE economic sectors"
+
+# Functions that build each part of a snapshot, keyed by the part's name
+partBuilders = {}
+
+# Snapshot of the data currently served, replaced as a whole when new outputs are published
+currentSnapshot = None
+snapshotLock = threading.Lock()
+
+# Process the reload thread was started in, as threads are not copied into forked workers
+watcherPid = None
+watcherLock = threading.Lock()
+
+
+# Decorator to register the function that builds a part of a snapshot, such as a dataset or an index
+def part(name):
+    def decorator(function):
+        partBuilders[name] = function
+        return function
+    return decorator
+
+
+# Function to get a stamp of the published outputs, which changes whenever the pipeline publishes new ones
+def getReleaseStamp():
+    paths = [releasePath] if releasePath.exists() else [script_dir / "data" / f"{name}.csv" for name in datasetNames]
+    return [(path.name, path.stat().st_size, path.stat().st_mtime_ns) for path in paths if path.exists()]
+
+
+# Function to create a snapshot, loading every dataset straight away so that the parts built from them later never read
+# outputs the pipeline has written since, the other parts are built the first time they are used
+def createSnapshot():
+    snapshot = {'stamp': getReleaseStamp(), 'parts': {}, 'lock': threading.RLock()}
+    for name in datasetNames:
+        getPart(('dataset', name), snapshot)
+    return snapshot
+
+
+# Function to get when the outputs of a snapshot were published, from the newest file in its stamp
+def getReleaseTime(snapshot):
+    return datetime.fromtimestamp(max([mtime for _, _, mtime in snapshot['stamp']], default=0) / 1e9, timezone.utc)
+
+
+# Function to get the snapshot of the data currently served, a request should use the same snapshot throughout
+def getSnapshot():
+    global currentSnapshot
+    if currentSnapshot is None:
+        with snapshotLock:
+            if currentSnapshot is None:
+                currentSnapshot = createSnapshot()
+    return currentSnapshot
+
+
+# Function to get a part of a snapshot, building it the first time, e.g. getPart(('dataset', 'genderPayGap'))
+def getPart(key, snapshot=None):
+    snapshot = snapshot or getSnapshot()
+    key = key if isinstance(key, tuple) else (key,)
+    parts = snapshot['parts']
+    if key not in parts:
+        with snapshot['lock']:
+            if key not in parts:
+                parts[key] = partBuilders[key[0]](snapshot, *key[1:])
+    return parts[key]
+
+
+# Function to load newly published outputs into a new snapshot and swap it in, returns True if the data was reloaded
+def reloadData(force=False):
+    global currentSnapshot
+    previous = getSnapshot()
+    if not force and getReleaseStamp() == previous['stamp']:
+        return False
+
+    # Build every part the current snapshot has built, so requests after the swap do not have to wait for them
+    reloadStart = time.perf_counter()
+    snapshot = createSnapshot()
+    for key in list(previous['parts']):
+        getPart(key, snapshot)
+
+    # Requests that already hold the previous snapshot keep using it, new requests get the new one
+    currentSnapshot = snapshot
+    print(f"Reloaded the data in {time.perf_counter() - reloadStart:.2f}s")
+    return True
+
+
+# Function run by the reload thread, checking for new outputs until the process stops
+def watchForReleases():
+    while True:
+        time.sleep(reloadInterval)
+        try:
+            reloadData()
+        except Exception as e:
+            # Keep serving the previous snapshot if the new outputs cannot be loaded, they are tried again next time
+            print(f"Error: Could not reload the data: {e}")
+
+
+# Function to start checking for new outputs in the background, once in each process that serves requests
+def startWatcher():
+    global watcherPid
+    if reloadInterval <= 0 or watcherPid == os.getpid():
+        return
+    with watcherLock:
+        if watcherPid == os.getpid():
+            return
+        watcherPid = os.getpid()
+        threading.Thread(target=watchForReleases, name="dataReload", daemon=True).start()
+
+
+# Function to load one of the pipeline outputs, mapped from its columnar copy
+@part('dataset')
+def loadDataset(snapshot, name):
+    from columnStore import readData
+    return readData(script_dir / "data" / f"{name}.csv")
+
+
+# Function to get the latest gender pay gap for all sectors, None if the pay gap statistics do not include it
+@part('headlinePayGap')
+def loadHeadlinePayGap(snapshot):
+    genderPayGap = getPart(('dataset', 'genderPayGap'), snapshot)
+    allSectors = genderPayGap[genderPayGap['NACE Rev 2 Sector'] == headlineSector]
+    if allSectors.empty:
+        return None
+    return float(allSectors.loc[allSectors['Year'].idxmax(), 'Gender Pay Gap (%)'])
@@ -0,0 +1,210 @@
+# Importing modules
+import hashlib
+import itertools
+import json
+import warnings
+import numpy as np
+from pathlib import Path
+from columnStore import createVersionFolder, removeOldVersions, saveArray, saveMeta
+import dataStore
+
+# Get the directory of the current script
+script_dir = Path(__file__).parent
+
+# Folder the earnings cube is saved to by the pipeline
+earningsCubePath = script_dir / "data/earningsCube"
+
+# Dimensions of the cube, in the order of the array axes, and the values held for each cell
+cubeDimensions = ['Year', 'Sex', 'NACE Rev 2 Sector', 'Age Group']
+cubeMeasures = ['Median Annual Earnings (€)', 'Annual Change (%)']
+
+# Statistics precomputed for every roll-up, over the cells of the dimensions that are rolled up
+rollupStatistics = ['mean', 'median', 'max', 'min', 'count']
+
+
+# Function to calculate every roll-up statistic of an array, keeping only some of its axes
+def reduceCells(values, keepAxes):
+    keepAxes = list(keepAxes)
+    dropAxes = [axis for axis in range(values.ndim) if axis not in keepAxes]
+
+    # Put the kept axes first and flatten the rest into one axis, so each statistic is a single reduction
+    values = np.transpose(values, keepAxes + dropAxes)
+    shape = values.shape[:len(keepAxes)]
+    values = values.reshape(shape + (int(np.prod(values.shape[len(keepAxes):])),))
+
+    # Groups without any values give NaN, which is expected, so the warnings are hidden
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return {
+            'mean': np.nanmean(values, axis=-1),
+            'median': np.nanmedian(values, axis=-1),
+            'max': np.nanmax(values, axis=-1),
+            'min': np.nanmin(values, axis=-1),
+            'count': np.count_nonzero(~np.isnan(values), axis=-1).astype('float64'),
+        }
+
+
+# Function to build the cube from the observations, with one dense array per measure indexed by category codes
+def buildCube(observations):
+    categories, codes = [], []
+    for dimension in cubeDimensions:
+        column = observations[dimension].astype('category')
+        categories.append(column.cat.categories.tolist())
+        codes.append(column.cat.codes.to_numpy())
+    shape = tuple(len(values) for values in categories)
+
+    # Place each observation in its cell, cells without an observation are NaN
+    cells = {}
+    for measure in cubeMeasures:
+        array = np.full(shape, np.nan)
+        array[tuple(codes)] = observations[measure].to_numpy(dtype='float64')
+        cells[measure] = array
+
+    # Precompute the roll-up for every combination of dimensions that are kept, down to the grand total
+    rollups = {}
+    for size in range(len(cubeDimensions)):
+        for keepAxes in itertools.combinations(range(len(cubeDimensions)), size):
+            rollups[keepAxes] = {measure: reduceCells(cells[measure], keepAxes) for measure in cubeMeasures}
+
+    # Fingerprint the content, so clients can tell when the data behind a query has changed
+    digest = hashlib.sha256(json.dumps(categories).encode("utf-8"))
+    for measure in cubeMeasures:
+        digest.update(np.ascontiguousarray(cells[measure]).tobytes())
+    return createCube(categories, cells, rollups, digest.hexdigest()[:16])
+
+
+# Function to put the parts of a cube together with the lookups used to answer queries
+def createCube(categories, cells, rollups, version):
+    return {
+        'categories': categories,
+        'labels': [np.array(values, dtype=object) for values in categories],
+        'lookups': [{str(value): code for code, value in enumerate(values)} for values in categories],
+        'cells': cells,
+        'rollups': rollups,
+        'version': version,
+    }
+
+
+# Function to get the file name of an array of the cube
+def getArrayFile(measurePosition, keepAxes=None, statistic=None):
+    if keepAxes is None:
+        return f"cells{measurePosition}.npy"
+    return f"rollup{measurePosition}_{''.join(str(axis) for axis in keepAxes) or 'total'}_{statistic}.npy"
+
+
+# Function to save a cube as one .npy file per array and a metadata file
+def saveCube(cube, path):
+    path = Path(path)
+    versionPath = createVersionFolder(path)
+    for measurePosition, measure in enumerate(cubeMeasures):
+        saveArray(versionPath / getArrayFile(measurePosition), cube['cells'][measure])
+        for keepAxes, statistics in cube['rollups'].items():
+            for statistic in rollupStatistics:
+                saveArray(versionPath / getArrayFile(measurePosition, keepAxes, statistic), statistics[measure][statistic])
+
+    # Write the metadata last, so it always describes arrays that have been saved, and point it at their folder
+    saveMeta(path, {'dimensions': cubeDimensions, 'measures': cubeMeasures, 'categories': cube['categories'],
+                    'version': cube['version'], 'folder': versionPath.name})
+    removeOldVersions(path, versionPath.name)
+
+
+# Function to load a saved cube with its arrays memory-mapped, returns None if there is no saved cube
+def loadCube(path):
+    path = Path(path)
+    if not (path / "meta.json").exists():
+        return None
+    with open(path / "meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta['dimensions'] != cubeDimensions or meta['measures'] != cubeMeasures or 'folder' not in meta:
+        return None
+
+    # Function to load one array of the cube
+    def load(*args):
+        return np.load(path / meta['folder'] / getArrayFile(*args), mmap_mode='r', allow_pickle=False)
+
+    cells, rollups = {}, {}
+    for measurePosition, measure in enumerate(cubeMeasures):
+        cells[measure] = load(measurePosition)
+    for size in range(len(cubeDimensions)):
+        for keepAxes in itertools.combinations(range(len(cubeDimensions)), size):
+            rollups[keepAxes] = {
+                measure: {statistic: load(measurePosition, keepAxes, statistic) for statistic in rollupStatistics}
+                for measurePosition, measure in enumerate(cubeMeasures)
+            }
+    return createCube(meta['categories'], cells, rollups, meta['version'])
+
+
+# Function to load the cube for a snapshot of the app's data, building it from the source data if the pipeline has not saved one
+@dataStore.part('earningsCube')
+def loadEarningsCube(snapshot):
+    cube = loadCube(earningsCubePath)
+    if cube is None:
+        import dataProcessing
+        cube = buildCube(dataProcessing.readObservations(dataProcessing.sourceDataPath))
+        saveCube(cube, earningsCubePath)
+    return cube
+
+
+# Function to get the cube of the data currently served
+def getCube(snapshot=None):
+    return dataStore.getPart('earningsCube', snapshot)
+
+
+# Function to get the codes of the cells to read along one axis from the filter values, every code if it is not filtered
+def getAxisIndex(cube, axis, values=None):
+    if values is None:
+        return np.arange(len(cube['categories'][axis]), dtype=np.intp)
+    lookup = cube['lookups'][axis]
+    unknown = [value for value in values if str(value) not in lookup]
+    if unknown:
+        raise ValueError(f"Unknown {cubeDimensions[axis]} '{unknown[0]}'.")
+    return np.array([lookup[str(value)] for value in values], dtype=np.intp)
+
+
+# Function to answer a query from the cube, filtering each dimension and grouping by some of them
+def queryCube(cube, filters=None, groupBy=None, measures=None, statistic='mean'):
+    filters = filters or {}
+    groupBy = cubeDimensions if groupBy is None else groupBy
+    measures = cubeMeasures if measures is None else measures
+    for name in list(filters) + list(groupBy):
+        if name not in cubeDimensions:
+            raise ValueError(f"Unknown dimension '{name}'.")
+    if not measures:
+        raise ValueError("At least one measure is needed.")
+    for measure in measures:
+        if measure not in cubeMeasures:
+            raise ValueError(f"Unknown measure '{measure}'.")
+    if statistic not in rollupStatistics:
+        raise ValueError(f"Unknown statistic '{statistic}'.")
+
+    # Turn the filter values into the codes of the cells to read
+    indexes = [getAxisIndex(cube, axis, filters.get(dimension)) for axis, dimension in enumerate(cubeDimensions)]
+    keepAxes = tuple(axis for axis, dimension in enumerate(cubeDimensions) if dimension in groupBy)
+
+    # Read each measure from the cells, a precomputed roll-up, or a roll-up of just the filtered cells
+    results = {}
+    for measure in measures:
+        if len(keepAxes) == len(cubeDimensions):
+            results[measure] = cube['cells'][measure][np.ix_(*indexes)]
+        elif all(cubeDimensions[axis] not in filters for axis in range(len(cubeDimensions)) if axis not in keepAxes):
+            results[measure] = cube['rollups'][keepAxes][measure][statistic][np.ix_(*[indexes[axis] for axis in keepAxes])]
+        else:
+            results[measure] = reduceCells(cube['cells'][measure][np.ix_(*indexes)], keepAxes)[statistic]
+        # The grand total is a single value, so give it one axis like every other result
+        results[measure] = np.reshape(results[measure], results[measure].shape or (1,))
+
+    # Only return the groups that have a value, counts of zero are groups without any cells
+    present = np.zeros(results[measures[0]].shape, dtype=bool)
+    for measure in measures:
+        values = results[measure]
+        present |= values > 0 if len(keepAxes) < len(cubeDimensions) and statistic == 'count' else ~np.isnan(values)
+    positions = np.nonzero(present)
+
+    # Build one row per group, with the labels of its dimensions and the value of each measure
+    columns = {}
+    for position, axis in zip(positions, keepAxes):
+        columns[cubeDimensions[axis]] = cube['labels'][axis][indexes[axis][position]].tolist()
+    for measure in measures:
+        values = np.asarray(results[measure])[positions]
+        columns[measure] = [None if np.isnan(value) else value for value in values.tolist()]
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
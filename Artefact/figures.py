@@ -0,0 +1,137 @@
+# Importing modules
+import hashlib
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+from columnStore import getFileStamp
+
+# Get the directory of the current script
+script_dir = Path(__file__).parent
+
+# File the pipeline saves the pre-rendered figures to, one compressed member per figure
+figureBundlePath = script_dir / "data/figureBundle.zip"
+
+# Columns that can be plotted by the graphs
+graphColumns = ['Median Annual Earnings (€)', 'Annual Change (%)']
+
+# Largest number of worker processes used to render the figures
+maxRenderWorkers = 8
+
+
+# Function to build lookup indexes of the cleaned data, so a figure's series can be found without scanning the whole dataframe
+def getSeriesIndexes(df):
+    seriesBySexSector = {
+        key: {column: group[column].to_numpy() for column in ['Year'] + graphColumns}
+        for key, group in df.groupby(['Sex', 'NACE Rev 2 Sector'], observed=True, sort=False)
+    }
+    seriesBySexYear = {
+        key: {column: group[column].to_numpy() for column in ['NACE Rev 2 Sector'] + graphColumns}
+        for key, group in df.groupby(['Sex', 'Year'], observed=True, sort=False)
+    }
+    return seriesBySexSector, seriesBySexYear
+
+
+# Function to serialize the line graph of a column for a sex and sector
+def createLineFigure(series, sex, sector, column):
+    import plotly.express as px
+    return px.line(series, x='Year', y=column, title=f'{column} for {sector} by Year ({sex})').to_json()
+
+
+# Function to serialize the bar chart of a column for a sex and year
+def createBarFigure(series, sex, year, column):
+    import plotly.express as px
+    return px.histogram(series, x='NACE Rev 2 Sector', y=column, title=f'{column} in {year} by Sector ({sex})').to_json()
+
+
+# Functions that serialize each kind of figure
+figureBuilders = {'line': createLineFigure, 'bar': createBarFigure}
+
+
+# Function to get the name of a figure in the bundle from its kind and the dropdown values it was drawn for
+def getFigureKey(kind, sex, value, column):
+    return "/".join(quote(str(part), safe="") for part in [kind, sex, value, column]) + ".json"
+
+
+# Function to render one figure in a worker process
+def renderFigure(job):
+    kind, series, sex, value, column = job
+    return figureBuilders[kind](series, sex, value, column)
+
+
+# Function to pre-render every figure the Dash graphs can show into a bundle, reusing figures whose data has not changed
+def saveFigureBundle(df, sourcePath, path=figureBundlePath):
+    import plotly
+    path = Path(path)
+    seriesBySexSector, seriesBySexYear = getSeriesIndexes(df)
+
+    # Load the figures from the last bundle, so only the figures whose data changed are rendered again
+    previousHashes, previousBundle = {}, None
+    if path.exists():
+        previousBundle = zipfile.ZipFile(path)
+        previousHashes = json.loads(previousBundle.read("manifest.json"))['hashes']
+
+    # Work out which figures have changed from everything that is drawn in them
+    jobs, figures = [], {}
+    for kind, seriesIndex in [('line', seriesBySexSector), ('bar', seriesBySexYear)]:
+        for (sex, value), series in seriesIndex.items():
+            for column in graphColumns:
+                key = getFigureKey(kind, sex, value, column)
+                content = json.dumps([kind, str(sex), str(value), column, plotly.__version__,
+                                      {name: [str(array.dtype), array.tolist()] for name, array in series.items()}])
+                contentHash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+                if previousHashes.get(key) == contentHash:
+                    figures[key] = (contentHash, previousBundle.read(key))
+                else:
+                    jobs.append((key, contentHash, (kind, series, sex, value, column)))
+    if previousBundle is not None:
+        previousBundle.close()
+
+    # Render the changed figures in parallel
+    if len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1, maxRenderWorkers)) as pool:
+            rendered = list(pool.map(renderFigure, [job for _, _, job in jobs], chunksize=8))
+    else:
+        rendered = [renderFigure(job) for _, _, job in jobs]
+    for (key, contentHash, _), figure in zip(jobs, rendered):
+        figures[key] = (contentHash, figure.encode("utf-8"))
+
+    # Write the bundle to a temporary file and swap it in, so the app never reads a half written bundle
+    manifest = {
+        'source': getFileStamp(sourcePath),
+        'plotly': plotly.__version__,
+        'hashes': {key: contentHash for key, (contentHash, _) in figures.items()},
+    }
+    temporaryPath = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with zipfile.ZipFile(temporaryPath, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr("manifest.json", json.dumps(manifest))
+        for key, (_, figure) in figures.items():
+            bundle.writestr(key, figure)
+    os.replace(temporaryPath, path)
+    return len(jobs), len(figures)
+
+
+# Function to load the figure bundle, returns None if there is no bundle or it was built from different data
+# The bundle is read into memory, so no file is held open, and processes forked after loading it do not share a file offset
+def loadFigureBundle(sourcePath, path=figureBundlePath):
+    import plotly
+    path = Path(path)
+    if not path.exists():
+        return None
+    bundle = zipfile.ZipFile(io.BytesIO(path.read_bytes()))
+    manifest = json.loads(bundle.read("manifest.json"))
+    if manifest['source'] != getFileStamp(sourcePath) or manifest['plotly'] != plotly.__version__:
+        bundle.close()
+        return None
+    return {'zip': bundle, 'keys': set(manifest['hashes'])}
+
+
+# Function to read a pre-rendered figure from the bundle, returns None if it is not in the bundle
+def readFigure(bundle, kind, sex, value, column):
+    key = getFigureKey(kind, sex, value, column)
+    if bundle is None or key not in bundle['keys']:
+        return None
+    return bundle['zip'].read(key).decode("utf-8")
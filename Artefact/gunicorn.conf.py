@@ -0,0 +1,65 @@
+# Importing modules
+import multiprocessing
+import os
+import tempfile
+
+# Settings for serving the app with gunicorn, each can be changed with an environment variable:
+#   gunicorn --config gunicorn.conf.py
+# gunicorn reads this file automatically when it is started from this folder
+
+# The application, loaded once in the master process so the workers share its memory
+wsgi_app = "wsgi:application"
+preload_app = True
+
+# Address to listen on, and the number of worker processes and threads in each worker
+bind = os.environ.get('GUNICORN_BIND', "0.0.0.0:5000")
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = "gthread"
+
+# Seconds a request can take before its worker is restarted, and that workers are given to finish
+# their requests when they are stopped or reloaded with SIGHUP
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Optionally restart each worker after a number of requests, with some jitter so they do not all restart at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# Log requests and errors to the console
+accesslog = "-"
+errorlog = "-"
+
+# Folder where each worker saves its metrics, so /metrics reports the whole server and not only the worker that answers
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f"payGapMetrics-{os.getpid()}"))
+
+
+# Function run in the master before the app is loaded, removing the metrics of a previous run
+def on_starting(server):
+    import metrics
+    metrics.clearMetricsDirectory()
+
+
+# Function run in each worker as it stops, writing any survey responses it still has queued and saving its metrics
+def worker_exit(server, worker):
+    import metrics
+    import surveyDatabase
+    surveyDatabase.stopWriteBehind()
+    metrics.saveProcessMetrics()
+
+
+# Function run in the master when it is reloaded with SIGHUP, loading newly published data before the new workers are forked
+def on_reload(server):
+    import dataStore
+    dataStore.reloadData()
+
+
+# Function run in the master as it stops, removing the metrics the workers saved, and the folder if nothing else is in it
+def on_exit(server):
+    import metrics
+    metrics.clearMetricsDirectory()
+    try:
+        os.rmdir(os.environ['METRICS_DIR'])
+    except OSError:
+        pass
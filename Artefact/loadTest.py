@@ -0,0 +1,327 @@
+# Importing modules
+import argparse
+import csv
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+from benchmark import createSurveyDatabase, dashCallback, surveyFactors, surveySectors
+
+# Get the directory of the current script
+script_dir = Path(__file__).parent
+
+# Sexes and graph columns that can be chosen in the Dash graphs
+graphSexes = ['Both sexes', 'Male', 'Female']
+graphColumns = ['Median Annual Earnings (€)', 'Annual Change (%)']
+
+# Tables of the data page, with the URL prefix, page size and columns that can be sorted by of each
+tableApps = [
+    ('/dash3', 13, ['Year', 'NACE Rev 2 Sector', 'Gender Pay Gap (%)', 'Difference in Earnings (€)']),
+    ('/dash4', 14, ['NACE Rev 2 Sector', 'Mean Annual Change']),
+    ('/dash5', 3, ['Sex', 'Mean Annual Change']),
+    ('/dash6', 14, ['Year', 'Mean Annual Change']),
+]
+
+# Filters typed into the table filter boxes
+tableFilters = ['', '', '{Year} s>= 2015', '{Gender Pay Gap (%)} s> 10', '{NACE Rev 2 Sector} contains construction']
+
+# Weights of the read requests in the mixed workload, and of the write requests among the writes
+readWeights = {'summary': 3, 'summaryFiltered': 1, 'recommendations': 2, 'graph1': 3, 'graph2': 3, 'table': 3}
+writeWeights = {'submit': 9, 'bulk': 1}
+
+# Text written to the server's log when a request failed because another writer held the database lock
+lockErrorPattern = re.compile(r"database is locked|database table is locked")
+
+
+# Function to read the sexes, sectors and years that can be chosen in the Dash graphs from the cleaned data
+def getGraphChoices():
+    with open(script_dir / "data/cleanedData.csv", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    return sorted({row['NACE Rev 2 Sector'] for row in rows}), sorted({row['Year'] for row in rows})
+
+
+# Function to create the functions that build each kind of request, as (name, method, path, body, headers)
+def createRequestBuilders(batchSize):
+    sectors, years = getGraphChoices()
+    jsonHeaders = {'Content-Type': "application/json"}
+
+    # Function to build a Dash callback request
+    def dashRequest(name, prefix, outputs, inputs):
+        return name, 'POST', f"{prefix}/_dash-update-component", json.dumps(dashCallback(outputs, inputs)), jsonHeaders
+
+    # Function to build a request for a random page of a random table, sorted and filtered at random
+    def tableRequest(rng):
+        prefix, pageSize, sortColumns = rng.choice(tableApps)
+        return dashRequest(f"POST {prefix} table page", prefix, ['table.data', 'table.page_count'], {
+            'table.page_current': rng.randrange(3), 'table.page_size': pageSize,
+            'table.sort_by': [{'column_id': rng.choice(sortColumns), 'direction': rng.choice(['asc', 'desc'])}],
+            'table.filter_query': rng.choice(tableFilters) if prefix == '/dash3' else '',
+        })
+
+    # Function to build a random survey response, with the same form fields as the survey page
+    def response(rng):
+        return {'sector': rng.choice(surveySectors), 'factors': rng.choice(surveyFactors),
+                'payGap': round(rng.uniform(5, 30), 2), 'gov': rng.random() < 0.4}
+
+    return {
+        'summary': lambda rng: ("GET /summary", 'GET', "/summary", None, {}),
+        'summaryFiltered': lambda rng: ("GET /summary?sector", 'GET', "/summary?" + urlencode({'sector': rng.choice(surveySectors)}), None, {}),
+        'recommendations': lambda rng: ("GET /recommendations", 'GET', "/recommendations", None, {}),
+        'graph1': lambda rng: dashRequest("POST /dash1 updateGraph1", "/dash1", ['graph-content.figure'], {
+            'sex-dropdown.value': rng.choice(graphSexes), 'sector-dropdown.value': rng.choice(sectors),
+            'graph-controls.value': rng.choice(graphColumns)}),
+        'graph2': lambda rng: dashRequest("POST /dash2 updateGraph2", "/dash2", ['graph-content.figure'], {
+            'sex-dropdown.value': rng.choice(graphSexes), 'year-dropdown.value': rng.choice(years),
+            'graph-controls.value': rng.choice(graphColumns)}),
+        'table': tableRequest,
+        'submit': lambda rng: ("POST /submit", 'POST', "/submit", urlencode({key: int(value) if key == 'gov' else value
+                                                                            for key, value in response(rng).items()}),
+                               {'Content-Type': "application/x-www-form-urlencoded"}),
+        'bulk': lambda rng: (f"POST /api/responses ({batchSize})", 'POST', "/api/responses",
+                             json.dumps([response(rng) for _ in range(batchSize)]), jsonHeaders),
+    }
+
+
+# Function to choose the next kind of request, a write with the given probability and otherwise a read
+def chooseRequest(rng, writeRatio):
+    weights = writeWeights if rng.random() < writeRatio else readWeights
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+# Function to send one request on a kept-alive connection, returning the status and body of the response
+def sendRequest(connection, method, path, body, headers):
+    connection.request(method, path, body=body.encode("utf-8") if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    data = response.read()
+    return response.status, data
+
+
+# Function run by each simulated client, sending requests one after another until the test ends
+def runClient(clientNumber, address, builders, args, deadline, results, resultsLock):
+    rng = random.Random(args.seed * 1000 + clientNumber)
+    connection = http.client.HTTPConnection(*address, timeout=args.timeout)
+    sent = 0
+    while time.perf_counter() < deadline and (args.requests is None or sent < args.requests):
+        name, method, path, body, headers = builders[chooseRequest(rng, args.write_ratio)](rng)
+        start = time.perf_counter()
+        try:
+            status, data = sendRequest(connection, method, path, body, headers)
+        except (OSError, http.client.HTTPException):
+            # Open a new connection after a failure, the failed request is counted as an error
+            connection.close()
+            connection = http.client.HTTPConnection(*address, timeout=args.timeout)
+            status, data = None, b""
+        elapsed = time.perf_counter() - start
+        sent += 1
+
+        # Saved bulk responses are counted from the reply, a redirect means the survey form was saved
+        saved = 0
+        if status == 201:
+            saved = json.loads(data).get('inserted', 0)
+        elif status == 302 and path == "/submit":
+            saved = 1
+        lockError = status == 503 and b"locked" in data
+        with resultsLock:
+            endpoint = results.setdefault(name, {'times': [], 'errors': 0, 'lockErrors': 0, 'saved': 0})
+            endpoint['times'].append(elapsed)
+            endpoint['errors'] += status is None or status >= 400
+            endpoint['lockErrors'] += lockError
+            endpoint['saved'] += saved
+    connection.close()
+
+
+# Function to get a percentile of sorted times, using the nearest rank
+def getPercentile(times, percentile):
+    return times[min(len(times) - 1, int(len(times) * percentile / 100))] if times else None
+
+
+# Function to start the app on a local port with a seeded survey database, returning the process and its log file
+def startServer(server, port, databasePath, workers, threads, logPath):
+    env = {**os.environ, 'SURVEY_DB': str(databasePath), 'DATA_RELOAD_INTERVAL': "0"}
+    if server == 'gunicorn':
+        env.update({'GUNICORN_BIND': f"127.0.0.1:{port}", 'GUNICORN_WORKERS': str(workers), 'GUNICORN_THREADS': str(threads)})
+        command = [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "--access-logfile", "/dev/null"]
+    elif server == 'waitress':
+        command = [sys.executable, "-m", "waitress", f"--listen=127.0.0.1:{port}", f"--threads={threads}", "wsgi:application"]
+    else:
+        # The Werkzeug server is used where neither is installed, it runs every request in its own thread
+        command = [sys.executable, "-c", "import wsgi\nfrom werkzeug.serving import run_simple\n"
+                   f"run_simple('127.0.0.1', {port}, wsgi.application, threaded=True)"]
+    logFile = open(logPath, "w", encoding="utf-8")
+    process = subprocess.Popen(command, cwd=script_dir, env=env, stdout=logFile, stderr=subprocess.STDOUT)
+    return process, logFile
+
+
+# Function to wait until the server answers, returns False if it stopped or did not start in time
+def waitForServer(address, process, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            connection = http.client.HTTPConnection(*address, timeout=5)
+            connection.request('GET', "/poll")
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+# Function to stop the server gracefully, so any survey responses it still has queued are written
+def stopServer(process, logFile):
+    process.terminate()
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    logFile.close()
+
+
+# Function to pick the server to start, gunicorn where it is available
+def getDefaultServer():
+    for server in (['waitress'] if platform.system() == "Windows" else ['gunicorn']):
+        try:
+            __import__(server)
+            return server
+        except ImportError:
+            pass
+    return 'werkzeug'
+
+
+# Function to send one request of every kind, so anything built on first use is not measured
+def warmUp(address, builders, seed):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(*address, timeout=120)
+    for kind, build in builders.items():
+        if kind not in writeWeights:
+            sendRequest(connection, *build(rng)[1:])
+    connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Put a reproducible mixed load on the app and report the latency of each endpoint.")
+    parser.add_argument('--url', help="address of a server that is already running, instead of starting one "
+                                      "(its survey database is written to)")
+    parser.add_argument('--server', choices=['gunicorn', 'waitress', 'werkzeug'], default=getDefaultServer(),
+                        help="server to start the app with")
+    parser.add_argument('--port', type=int, default=5055, help="port the started server listens on")
+    parser.add_argument('--workers', type=int, default=2, help="worker processes of the started gunicorn server")
+    parser.add_argument('--threads', type=int, default=4, help="threads in each worker of the started server")
+    parser.add_argument('--survey-size', type=int, default=10000, help="number of responses in the seeded survey database")
+    parser.add_argument('--concurrency', type=int, default=16, help="number of clients sending requests at the same time")
+    parser.add_argument('--duration', type=float, default=30, help="seconds the load is applied for")
+    parser.add_argument('--requests', type=int, help="number of requests each client sends, instead of a duration")
+    parser.add_argument('--write-ratio', type=float, default=0.2, help="fraction of requests that save survey responses")
+    parser.add_argument('--batch-size', type=int, default=100, help="number of responses in each bulk request")
+    parser.add_argument('--timeout', type=float, default=60, help="seconds before a request is given up on")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random choices, so runs can be repeated")
+    parser.add_argument('--output', default="loadTestResults.json", help="file the results are written to")
+    args = parser.parse_args()
+
+    # Make the modules next to this script importable wherever it is run from
+    sys.path.insert(0, str(script_dir))
+    builders = createRequestBuilders(args.batch_size)
+
+    with tempfile.TemporaryDirectory() as workDir:
+        # Start the app against a freshly seeded database, unless a running server was given
+        process = logFile = databasePath = None
+        if args.url:
+            address = (urlsplit(args.url).hostname, urlsplit(args.url).port or 80)
+        else:
+            address = ("127.0.0.1", args.port)
+            databasePath = Path(workDir) / "survey.db"
+            createSurveyDatabase(databasePath, args.survey_size, seed=args.seed)
+            process, logFile = startServer(args.server, args.port, databasePath, args.workers, args.threads, Path(workDir) / "server.log")
+        if not waitForServer(address, process):
+            if process is not None:
+                stopServer(process, logFile)
+                print((Path(workDir) / "server.log").read_text(encoding="utf-8")[-2000:])
+            sys.exit(f"The server at {address[0]}:{address[1]} did not answer.")
+
+        try:
+            warmUp(address, builders, args.seed)
+
+            # Apply the load from every client at once
+            print(f"Sending requests from {args.concurrency} clients, {args.write_ratio:.0%} of them writes...")
+            results, resultsLock = {}, threading.Lock()
+            loadStart = time.perf_counter()
+            deadline = loadStart + (args.duration if args.requests is None else float('inf'))
+            clients = [threading.Thread(target=runClient, args=(number, address, builders, args, deadline, results, resultsLock))
+                       for number in range(args.concurrency)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            loadSeconds = time.perf_counter() - loadStart
+        finally:
+            if process is not None:
+                stopServer(process, logFile)
+
+        # Count the lock errors the server logged, and the responses that were actually saved
+        serverLockErrors = savedResponses = None
+        if process is not None:
+            serverLockErrors = len(lockErrorPattern.findall((Path(workDir) / "server.log").read_text(encoding="utf-8")))
+            with sqlite3.connect(databasePath) as conn:
+                savedResponses = conn.execute("SELECT count(*) FROM responses").fetchone()[0] - args.survey_size
+
+    # Report the throughput and latency of each endpoint
+    endpoints = []
+    print(f"{'Endpoint':<34} {'Requests':>8} {'Errors':>6} {'Req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, endpoint in sorted(results.items()):
+        times = sorted(endpoint['times'])
+        summary = {
+            'endpoint': name,
+            'requests': len(times),
+            'errors': endpoint['errors'],
+            'lockErrors': endpoint['lockErrors'],
+            'requestsPerSecond': len(times) / loadSeconds,
+            'p50Seconds': getPercentile(times, 50),
+            'p95Seconds': getPercentile(times, 95),
+            'p99Seconds': getPercentile(times, 99),
+        }
+        endpoints.append(summary)
+        print(f"{name:<34} {len(times):>8} {endpoint['errors']:>6} {summary['requestsPerSecond']:>8.1f} "
+              f"{summary['p50Seconds'] * 1000:>8.1f} {summary['p95Seconds'] * 1000:>8.1f} {summary['p99Seconds'] * 1000:>8.1f}")
+
+    totalRequests = sum(summary['requests'] for summary in endpoints)
+    acceptedResponses = sum(endpoint['saved'] for endpoint in results.values())
+    print(f"Total: {totalRequests} requests in {loadSeconds:.1f}s, {totalRequests / loadSeconds:.1f} requests per second")
+    print(f"SQLite lock errors: {sum(summary['lockErrors'] for summary in endpoints)} returned to clients"
+          + (f", {serverLockErrors} in the server log" if serverLockErrors is not None else ""))
+    if savedResponses is not None:
+        print(f"Survey responses: {acceptedResponses} accepted, {savedResponses} saved to the database")
+
+    # Save the results so runs can be compared
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            'run': {
+                'time': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'server': args.url or args.server,
+                'settings': {name: value for name, value in vars(args).items() if name not in ('url', 'output')},
+            },
+            'seconds': loadSeconds,
+            'requests': totalRequests,
+            'requestsPerSecond': totalRequests / loadSeconds,
+            'lockErrors': sum(summary['lockErrors'] for summary in endpoints),
+            'serverLogLockErrors': serverLockErrors,
+            'acceptedResponses': acceptedResponses,
+            'savedResponses': savedResponses,
+            'endpoints': endpoints,
+        }, f, indent=4)
+    print(f"Results saved to {args.output}")
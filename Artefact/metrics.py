@@ -0,0 +1,213 @@
+# Importing modules
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Upper bounds in seconds of the histogram buckets, the same as the Prometheus client defaults
+histogramBuckets = [0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0]
+
+# Description of each histogram, shown in the metrics output
+metricDescriptions = {
+    'http_request_duration_seconds': "Time taken to handle each Flask route and Dash request.",
+    'dash_callback_duration_seconds': "Time taken by each Dash callback.",
+    'sqlite_query_duration_seconds': "Time taken by each survey database query.",
+    'pipeline_stage_duration_seconds': "Time taken by each stage of the data pipeline.",
+    'survey_write_behind_retries_total': "Batches of queued survey responses that had to be written again because the database was locked.",
+    'survey_write_behind_failures_total': "Queued survey responses the database rejected, which were not saved.",
+}
+
+# Recorded histograms, keyed by metric name and then by the label values, holding the bucket counts, sum and count
+histograms = {}
+histogramsLock = threading.Lock()
+
+# Recorded counters, keyed by metric name and then by the label values
+counters = {}
+
+# Folder where every process saves its metrics, so /metrics adds up all the gunicorn workers and not only the one
+# that answers, set with the METRICS_DIR environment variable. Without it each process only reports its own metrics
+metricsDirectory = os.environ.get('METRICS_DIR')
+
+# Seconds between each process saving its metrics to the folder
+metricsSaveInterval = 5
+
+# Process the saving thread was started in, and the file that process saves its metrics to
+saverPid = None
+saverLock = threading.Lock()
+processMetricsPath = None
+
+
+# Function run in each forked process, which starts with no metrics of its own instead of a copy of its parent's
+def resetAfterFork():
+    global histogramsLock, saverLock
+    histogramsLock = threading.Lock()
+    saverLock = threading.Lock()
+    histograms.clear()
+    counters.clear()
+
+
+# Windows has no fork, so there is nothing to reset there
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=resetAfterFork)
+
+
+# Function to save the metrics of this process to the metrics folder, replacing what it saved before
+def saveProcessMetrics():
+    if metricsDirectory is None or processMetricsPath is None:
+        return
+    with histogramsLock:
+        saved = {'histograms': {name: [[list(key), histogram] for key, histogram in values.items()]
+                                for name, values in histograms.items()},
+                 'counters': {name: [[list(key), count] for key, count in values.items()] for name, values in counters.items()}}
+        data = json.dumps(saved)
+    temporaryPath = processMetricsPath.with_name(processMetricsPath.name + ".tmp")
+    temporaryPath.write_text(data)
+    os.replace(temporaryPath, processMetricsPath)
+
+
+# Function run in a background thread to save the metrics of this process every few seconds
+def saveMetricsRegularly():
+    while True:
+        time.sleep(metricsSaveInterval)
+        try:
+            saveProcessMetrics()
+        except OSError as e:
+            print(f"Error: Could not save the metrics: {e}")
+
+
+# Function to start saving the metrics of this process, once in each process, named by process ID and start time so a
+# reused process ID does not overwrite the metrics of a worker that has stopped
+def startSaver():
+    global saverPid, processMetricsPath
+    if metricsDirectory is None or saverPid == os.getpid():
+        return
+    with saverLock:
+        if saverPid == os.getpid():
+            return
+        saverPid = os.getpid()
+        processMetricsPath = Path(metricsDirectory) / f"metrics-{os.getpid()}-{time.time_ns()}.json"
+        threading.Thread(target=saveMetricsRegularly, name="metricsSaver", daemon=True).start()
+
+
+# Function to remove the metrics saved by a previous run, called once before the workers are started
+def clearMetricsDirectory():
+    if metricsDirectory is None:
+        return
+    Path(metricsDirectory).mkdir(parents=True, exist_ok=True)
+    for path in Path(metricsDirectory).glob("metrics-*.json"):
+        path.unlink(missing_ok=True)
+
+
+# Function to record how long something took in a histogram
+def observe(name, labels, seconds):
+    startSaver()
+    key = tuple(sorted(labels.items()))
+    with histogramsLock:
+        histogram = histograms.setdefault(name, {}).get(key)
+        if histogram is None:
+            histogram = {'buckets': [0] * len(histogramBuckets), 'sum': 0.0, 'count': 0}
+            histograms[name][key] = histogram
+        for position, bound in enumerate(histogramBuckets):
+            if seconds <= bound:
+                histogram['buckets'][position] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+
+# Function to add to a counter
+def increment(name, amount=1, **labels):
+    startSaver()
+    key = tuple(sorted(labels.items()))
+    with histogramsLock:
+        counters.setdefault(name, {})[key] = counters.get(name, {}).get(key, 0) + amount
+
+
+# Context manager to time a block of code and record it in a histogram
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, labels, time.perf_counter() - start)
+
+
+# Decorator to time every call of a function and record it in a histogram
+def timed(name, **labels):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Function to format label values for the Prometheus text format
+def formatLabels(labels):
+    if not labels:
+        return ""
+    escaped = [(key, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for key, value in labels]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+# Function to add the histograms and counters of one process to the totals
+def addMetrics(totalHistograms, totalCounters, processHistograms, processCounters):
+    for name, values in processHistograms.items():
+        for key, histogram in values:
+            total = totalHistograms.setdefault(name, {}).setdefault(key, {'buckets': [0] * len(histogramBuckets), 'sum': 0.0,
+                                                                          'count': 0})
+            total['buckets'] = [count + added for count, added in zip(total['buckets'], histogram['buckets'])]
+            total['sum'] += histogram['sum']
+            total['count'] += histogram['count']
+    for name, values in processCounters.items():
+        for key, count in values:
+            totalCounters.setdefault(name, {})[key] = totalCounters.get(name, {}).get(key, 0) + count
+
+
+# Function to add up the metrics of this process and those saved by every other process, including workers that have
+# stopped, so the counts keep going up when gunicorn replaces a worker
+def collectMetrics():
+    totalHistograms = {}
+    totalCounters = {}
+    with histogramsLock:
+        addMetrics(totalHistograms, totalCounters, {name: values.items() for name, values in histograms.items()},
+                   {name: values.items() for name, values in counters.items()})
+    if metricsDirectory is None:
+        return totalHistograms, totalCounters
+    for path in Path(metricsDirectory).glob("metrics-*.json"):
+        if path == processMetricsPath:
+            continue
+        try:
+            saved = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        addMetrics(totalHistograms, totalCounters,
+                   {name: [(tuple(map(tuple, key)), histogram) for key, histogram in values]
+                    for name, values in saved['histograms'].items()},
+                   {name: [(tuple(map(tuple, key)), count) for key, count in values] for name, values in saved['counters'].items()})
+    return totalHistograms, totalCounters
+
+
+# Function to write every histogram and counter in the Prometheus text format
+def renderMetrics():
+    totalHistograms, totalCounters = collectMetrics()
+    lines = []
+    for name in sorted(totalCounters):
+        lines.append(f"# HELP {name} {metricDescriptions.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        for key, count in sorted(totalCounters[name].items()):
+            lines.append(f"{name}{formatLabels(key)} {count}")
+    for name in sorted(totalHistograms):
+        lines.append(f"# HELP {name} {metricDescriptions.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in sorted(totalHistograms[name].items()):
+            for bound, count in zip(histogramBuckets, histogram['buckets']):
+                lines.append(f"{name}_bucket{formatLabels(key + (('le', bound),))} {count}")
+            lines.append(f"{name}_bucket{formatLabels(key + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{formatLabels(key)} {histogram['sum']}")
+            lines.append(f"{name}_count{formatLabels(key)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,107 @@
+# Importing modules
+import numpy as np
+import pandas as pd
+from earningsCube import cubeDimensions, getAxisIndex
+
+# Dimensions the gender pay gap is calculated over, with the year last so the change between years runs along one axis
+payGapDimensions = ['NACE Rev 2 Sector', 'Age Group', 'Year']
+
+# Columns of the gender pay gap statistics, after the dimension columns
+payGapColumns = ['Difference in Earnings (€)', 'Difference in Annual Change (%)', 'Gender Pay Gap (%)', 'Change in Gender Pay Gap (%)']
+
+
+# Function to place the male and female earnings into aligned arrays, with one axis per dimension
+def alignEarnings(male, female, dimensions):
+    # Give every value of each dimension a code, in sorted order, from both sexes at once
+    labels, codes = [], []
+    for dimension in dimensions:
+        values = pd.concat([male[dimension], female[dimension]], ignore_index=True)
+        dimensionCodes, uniques = pd.factorize(values, sort=True)
+        labels.append(uniques)
+        codes.append((dimensionCodes[:len(male)], dimensionCodes[len(male):]))
+    shape = tuple(len(values) for values in labels)
+
+    # Place each row in its cell, recording which cells have a row for each sex
+    arrays = {}
+    for position, (sex, frame) in enumerate([('Male', male), ('Female', female)]):
+        cell = tuple(dimensionCodes[position] for dimensionCodes in codes)
+        exists = np.zeros(shape, dtype=bool)
+        exists[cell] = True
+        arrays[f'{sex} Exists'] = exists
+        for column in ['Median Annual Earnings (€)', 'Annual Change (%)']:
+            array = np.full(shape, np.nan)
+            array[cell] = frame[column].to_numpy(dtype='float64')
+            arrays[f'{sex} {column}'] = array
+    return labels, arrays
+
+
+# Function to calculate the gender pay gap statistics for every cell of aligned arrays, the year being the last axis
+def computePayGap(maleEarnings, femaleEarnings, maleChange, femaleChange, present):
+    difference = maleEarnings - femaleEarnings
+    changeDifference = np.round(maleChange - femaleChange, 1)
+    gap = np.round(difference / maleEarnings * 100, 2)
+
+    # Find the previous year that has both sexes for each cell, so gaps in the years are skipped like a sorted diff
+    years = np.arange(present.shape[-1])
+    latest = np.maximum.accumulate(np.where(present, years, -1), axis=-1)
+    previous = np.concatenate([np.full(present.shape[:-1] + (1,), -1), latest[..., :-1]], axis=-1)
+    previousGap = np.take_along_axis(gap, np.maximum(previous, 0), axis=-1)
+    gapChange = np.round(np.where(previous >= 0, gap - previousGap, np.nan), 2)
+    return dict(zip(payGapColumns, [difference, changeDifference, gap, gapChange]))
+
+
+# Function to calculate the gender pay gap statistics from male and female earnings, by sector, year and age group if present
+def getPayGapStatistics(male, female):
+    dimensions = [dimension for dimension in payGapDimensions if dimension in male.columns and dimension in female.columns]
+    labels, arrays = alignEarnings(male, female, dimensions)
+    present = arrays['Male Exists'] & arrays['Female Exists']
+    statistics = computePayGap(arrays['Male Median Annual Earnings (€)'], arrays['Female Median Annual Earnings (€)'],
+                               arrays['Male Annual Change (%)'], arrays['Female Annual Change (%)'], present)
+
+    # Keep the cells that have both sexes, which are already ordered by sector and then year
+    cells = np.nonzero(present)
+    data = {dimension: labels[axis].take(cells[axis]) for axis, dimension in enumerate(dimensions)}
+    data.update({column: values[cells] for column, values in statistics.items()})
+    return pd.DataFrame(data)[['Year'] + [dimension for dimension in dimensions if dimension != 'Year'] + payGapColumns]
+
+
+# Function to calculate the gender pay gap for every cell of an earnings cube, keeping it with the cube for later slices
+def getCubePayGap(cube):
+    if 'payGap' not in cube:
+        sexAxis = cubeDimensions.index('Sex')
+        sexes = cube['lookups'][sexAxis]
+        if 'Male' not in sexes or 'Female' not in sexes:
+            raise ValueError("The earnings cube needs both male and female earnings.")
+
+        # Select each sex and move the year (the first remaining axis) last, giving Sector x Age Group x Year
+        def select(measure, sex):
+            return np.moveaxis(np.take(cube['cells'][measure], sexes[sex], axis=sexAxis), 0, -1)
+
+        maleEarnings, femaleEarnings = select('Median Annual Earnings (€)', 'Male'), select('Median Annual Earnings (€)', 'Female')
+        present = ~np.isnan(maleEarnings) & ~np.isnan(femaleEarnings)
+        cube['payGap'] = computePayGap(maleEarnings, femaleEarnings, select('Annual Change (%)', 'Male'),
+                                       select('Annual Change (%)', 'Female'), present)
+        cube['payGapPresent'] = present
+    return cube['payGap'], cube['payGapPresent']
+
+
+# Function to get the gender pay gap for a slice of an earnings cube, filtered by year, sector and age group
+def queryPayGap(cube, filters=None):
+    filters = filters or {}
+    payGap, present = getCubePayGap(cube)
+
+    # Turn the filter values into codes along the cube's axes for each dimension
+    for name in filters:
+        if name not in payGapDimensions:
+            raise ValueError(f"Unknown dimension '{name}'.")
+    cubeAxes = {dimension: cubeDimensions.index(dimension) for dimension in payGapDimensions}
+    indexes = [getAxisIndex(cube, cubeAxes[dimension], filters.get(dimension)) for dimension in payGapDimensions]
+
+    # Read only the selected cells, then build one row for each cell with both sexes
+    selection = np.ix_(*indexes)
+    cells = np.nonzero(present[selection])
+    columns = {dimension: cube['labels'][cubeAxes[dimension]][indexes[axis][cells[axis]]].tolist()
+               for axis, dimension in enumerate(payGapDimensions)}
+    for column in payGapColumns:
+        columns[column] = [None if np.isnan(value) else value for value in payGap[column][selection][cells].tolist()]
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
@@ -1,7 +1,7 @@
 @echo off
 echo Starting Flask/Dash app with Waitress...
 cd /d "%~dp0"
-start "" cmd /k "py -m waitress --listen=127.0.0.1:5000 app:server"
+start "" cmd /k "py -m waitress --listen=127.0.0.1:5000 --threads=8 wsgi:application"
 timeout /t 5 >nul
 start "" http://127.0.0.1:5000/
 exit 	
\ No newline at end of file
@@ -0,0 +1,69 @@
+# Importing modules
+import gzip
+import os
+from pathlib import Path
+
+# Brotli is optional, without it only gzip variants are made
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Get the directory of the current script
+script_dir = Path(__file__).parent
+
+# Folder of the static files, compressed variants are saved next to each file
+staticPath = script_dir / "static"
+
+# Encodings responses can be compressed with, best first, and the file suffix of each variant
+encodingSuffixes = {'br': ".br", 'gzip': ".gz"} if brotli is not None else {'gzip': ".gz"}
+
+# Static files that are worth compressing, images such as JPG files are already compressed
+compressibleSuffixes = ['.svg', '.css', '.js', '.json', '.html']
+
+# Smallest body that is compressed, below this the headers cost more than is saved
+minimumSize = 1024
+
+
+# Function to compress data in an encoding, the pipeline uses the best compression as it only runs once per release
+def compress(data, encoding, best=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+# Function to get the path of a compressed variant of a file
+def getVariantPath(path, encoding):
+    return path.with_name(path.name + encodingSuffixes[encoding])
+
+
+# Function to get the compressed variants of a file that were made from its current content, keyed by encoding
+def getFileVariants(path):
+    sourceTime = path.stat().st_mtime_ns
+    variants = {}
+    for encoding in encodingSuffixes:
+        variantPath = getVariantPath(path, encoding)
+        if variantPath.exists() and variantPath.stat().st_mtime_ns >= sourceTime:
+            variants[encoding] = variantPath
+    return variants
+
+
+# Function to save the compressed variants of the static files that have changed, returns the number of files compressed
+def compressStaticFiles(folder=staticPath):
+    compressed = 0
+    for path in sorted(Path(folder).iterdir()):
+        if path.suffix.lower() not in compressibleSuffixes or path.stat().st_size < minimumSize:
+            continue
+        variants = getFileVariants(path)
+        if len(variants) == len(encodingSuffixes):
+            continue
+
+        # Write each variant to a temporary file and swap it in, so the server never sends half a file
+        data = path.read_bytes()
+        for encoding in encodingSuffixes:
+            variantPath = getVariantPath(path, encoding)
+            temporaryPath = variantPath.with_name(f"{variantPath.name}.{os.getpid()}.tmp")
+            temporaryPath.write_bytes(compress(data, encoding, best=True))
+            os.replace(temporaryPath, variantPath)
+        compressed += 1
+    return compressed
@@ -0,0 +1,510 @@
+# Importing modules
+import atexit
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import metrics
+
+# Get the directory of the current script
+script_dir = Path(__file__).parent
+
+# Path to the survey database, which can be changed with the SURVEY_DB environment variable
+databasePath = Path(os.environ.get('SURVEY_DB', script_dir / "survey.db"))
+
+# Seconds a connection waits for another writer to finish before giving up
+busyTimeout = 10
+
+# Number of compiled statements each connection keeps, so repeated queries are only prepared once
+statementCacheSize = 64
+
+# Largest number of queued responses written in a single transaction by the write-behind thread
+writeBehindBatchSize = 500
+
+# Seconds the write-behind thread waits before writing a batch again when the database is locked, doubled after each
+# attempt up to the maximum, and the number of attempts made while the server is stopping before giving up on the batch
+writeBehindRetryDelay = 0.5
+writeBehindMaxRetryDelay = 30
+writeBehindStopRetries = 3
+
+# Statements used by the survey routes
+insertResponseSql = "INSERT INTO responses (sector, factors, payGap, gov) VALUES (?, ?, ?, ?)"
+insertResponseFactorSql = "INSERT INTO responseFactors (responseId, factor, label, sector) VALUES (?, ?, ?, ?)"
+addFactorCountSql = """
+    INSERT INTO factorCounts (factor, label, count, firstId) VALUES (?, ?, ?, ?)
+    ON CONFLICT (factor) DO UPDATE SET count = count + excluded.count
+"""
+addFactorSectorCountSql = """
+    INSERT INTO factorSectorCounts (sector, factor, label, count, firstId) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (sector, factor) DO UPDATE SET count = count + excluded.count
+"""
+selectResponsesSql = "SELECT id, sector, factors, payGap, gov FROM responses"
+
+# Characters that separate several factors given in one answer, and the characters ignored when factors are compared
+factorSeparators = re.compile(r"[,;/|\n]+")
+factorPunctuation = re.compile(r"[\W_]+")
+
+# Version of the tables of running totals, raised whenever they change so that existing databases rebuild them
+aggregatesVersion = 2
+
+# Statements to remove the tables of running totals, run before they are created again for a new version
+dropAggregatesSql = [
+    "DROP TRIGGER IF EXISTS responsesInsertTotals",
+    "DROP TRIGGER IF EXISTS responsesDeleteTotals",
+    "DROP TRIGGER IF EXISTS responseFactorsDeleteCounts",
+    "DROP TABLE IF EXISTS factorCounts",
+    "DROP TABLE IF EXISTS factorSectorCounts",
+    "DROP TABLE IF EXISTS responseFactors",
+]
+
+# Tables of running totals, kept up to date by triggers whenever a response is added or deleted
+aggregateTablesSql = [
+    """
+    CREATE TABLE IF NOT EXISTS responseTotals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total INTEGER NOT NULL,
+        payGapSum REAL NOT NULL,
+        payGapCount INTEGER NOT NULL,
+        yesCount INTEGER NOT NULL
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS sectorCounts (sector TEXT PRIMARY KEY, count INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS sectorCountsCount ON sectorCounts (count DESC, sector)",
+    # The normalised factors of each response, with the text it was given as and the response's sector
+    """
+    CREATE TABLE IF NOT EXISTS responseFactors (
+        responseId INTEGER NOT NULL,
+        factor TEXT NOT NULL,
+        label TEXT NOT NULL,
+        sector TEXT,
+        PRIMARY KEY (responseId, factor)
+    ) WITHOUT ROWID
+    """,
+    # Counts of each factor overall and by sector, added to as responses are saved and indexed by count so the most
+    # common factors are read straight from the index. The label is the text the factor was first given as, and firstId
+    # breaks ties in the order the factors first appeared
+    "CREATE TABLE IF NOT EXISTS factorCounts (factor TEXT PRIMARY KEY, label TEXT NOT NULL, count INTEGER NOT NULL, firstId INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS factorCountsCount ON factorCounts (count DESC, firstId)",
+    """
+    CREATE TABLE IF NOT EXISTS factorSectorCounts (
+        sector TEXT NOT NULL,
+        factor TEXT NOT NULL,
+        label TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        firstId INTEGER NOT NULL,
+        PRIMARY KEY (sector, factor)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS factorSectorCountsCount ON factorSectorCounts (sector, count DESC, firstId)",
+    """
+    CREATE TRIGGER IF NOT EXISTS responsesInsertTotals AFTER INSERT ON responses
+    BEGIN
+        UPDATE responseTotals SET
+            total = total + 1,
+            payGapSum = payGapSum + coalesce(NEW.payGap, 0),
+            payGapCount = payGapCount + (NEW.payGap IS NOT NULL),
+            yesCount = yesCount + (NEW.gov = 1)
+        WHERE id = 1;
+        INSERT INTO sectorCounts (sector, count) SELECT NEW.sector, 1 WHERE NEW.sector IS NOT NULL
+            ON CONFLICT (sector) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS responsesDeleteTotals AFTER DELETE ON responses
+    BEGIN
+        UPDATE responseTotals SET
+            total = total - 1,
+            payGapSum = payGapSum - coalesce(OLD.payGap, 0),
+            payGapCount = payGapCount - (OLD.payGap IS NOT NULL),
+            yesCount = yesCount - (OLD.gov = 1)
+        WHERE id = 1;
+        UPDATE sectorCounts SET count = count - 1 WHERE sector = OLD.sector;
+        DELETE FROM sectorCounts WHERE sector = OLD.sector AND count = 0;
+        DELETE FROM responseFactors WHERE responseId = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS responseFactorsDeleteCounts AFTER DELETE ON responseFactors
+    BEGIN
+        UPDATE factorCounts SET count = count - 1 WHERE factor = OLD.factor;
+        DELETE FROM factorCounts WHERE factor = OLD.factor AND count = 0;
+        UPDATE factorSectorCounts SET count = count - 1 WHERE sector = OLD.sector AND factor = OLD.factor;
+        DELETE FROM factorSectorCounts WHERE sector = OLD.sector AND factor = OLD.factor AND count = 0;
+    END
+    """,
+]
+
+# Connections are kept per thread, as a sqlite3 connection cannot be shared between threads
+threadData = threading.local()
+
+# Queue of responses waiting to be written by the write-behind thread, None when it is not running
+writeQueue = None
+writeThread = None
+writeBehindLock = threading.Lock()
+
+# Whether survey submissions are written from a background thread, which is started in each process when first needed
+writeBehindEnabled = False
+
+
+# Function to open a new connection with the settings used by the app
+def connect():
+    conn = sqlite3.connect(databasePath, timeout=busyTimeout, cached_statements=statementCacheSize)
+    # Only sync at checkpoints, which is safe with WAL mode, and allow a larger page cache (in KiB)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-8000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+# Function to get the connection for the current thread, opening one the first time it is needed
+def getConnection():
+    # A connection inherited from a parent process must not be reused after a fork
+    conn = getattr(threadData, 'conn', None)
+    if conn is None or threadData.pid != os.getpid():
+        conn = connect()
+        threadData.conn = conn
+        threadData.pid = os.getpid()
+    return conn
+
+
+# Function to close the current thread's connection, it is opened again when next needed
+def closeConnection():
+    conn = getattr(threadData, 'conn', None)
+    if conn is not None:
+        conn.close()
+        threadData.conn = None
+
+
+# Function to switch to a different database file, closing this thread's connection to the old one
+def useDatabase(path):
+    global databasePath
+    closeConnection()
+    databasePath = Path(path)
+
+
+# Initialise the SQLite database
+def initDatabase():
+    conn = getConnection()
+    # Use write-ahead logging so readers are not blocked by writers, this setting is kept in the database file
+    conn.execute("PRAGMA journal_mode=WAL")
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sector TEXT,
+                factors TEXT,
+                payGap REAL,
+                '''
+                # Add a column to store the value of the response to
+                # the government question as a boolean
+                '''
+                gov BOOLEAN
+            )
+        ''')
+        # Index the columns that responses are grouped and filtered by
+        conn.execute("CREATE INDEX IF NOT EXISTS responsesSector ON responses (sector)")
+        conn.execute("CREATE INDEX IF NOT EXISTS responsesGov ON responses (gov)")
+        createAggregates(conn)
+
+
+# Function to create the tables of running totals used by the summary and recommendations pages
+def createAggregates(conn):
+    # Make sure only one process creates and fills the tables
+    conn.execute("BEGIN IMMEDIATE")
+
+    # Tables made by an older version of the app are removed and made again
+    outdated = conn.execute("PRAGMA user_version").fetchone()[0] < aggregatesVersion
+    if outdated:
+        for statement in dropAggregatesSql:
+            conn.execute(statement)
+    for statement in aggregateTablesSql:
+        conn.execute(statement)
+
+    # Fill the tables from the existing responses the first time they are created
+    if outdated or conn.execute("SELECT count(*) FROM responseTotals").fetchone()[0] == 0:
+        rebuildAggregates(conn)
+        conn.execute(f"PRAGMA user_version = {aggregatesVersion}")
+
+
+# Function to recalculate the running totals from every response
+def rebuildAggregates(conn):
+    conn.execute("DELETE FROM responseTotals")
+    conn.execute("DELETE FROM sectorCounts")
+    conn.execute("DELETE FROM factorCounts")
+    conn.execute("DELETE FROM factorSectorCounts")
+    conn.execute("DELETE FROM responseFactors")
+    conn.execute("""
+        INSERT INTO responseTotals (id, total, payGapSum, payGapCount, yesCount)
+        SELECT 1, count(*), coalesce(sum(payGap), 0), count(payGap), coalesce(sum(gov = 1), 0) FROM responses
+    """)
+    conn.execute("INSERT INTO sectorCounts (sector, count) SELECT sector, count(*) FROM responses WHERE sector IS NOT NULL GROUP BY sector")
+
+    # Index the factors of every response, in batches so the responses are not all loaded at once
+    cursor = conn.execute("SELECT id, sector, factors FROM responses ORDER BY id")
+    while True:
+        rows = cursor.fetchmany(writeBehindBatchSize)
+        if not rows:
+            break
+        indexFactors(conn, [row[0] for row in rows], [(row[1], row[2]) for row in rows])
+
+
+# Function to split a free-text answer into its factors, as (normalised factor, label) pairs.
+# Factors are compared in lower case without punctuation, so "Part-time work." and "part time work" are the same factor
+def tokeniseFactors(factors):
+    tokens = {}
+    for label in factorSeparators.split(factors or ""):
+        label = " ".join(label.split()).rstrip(".!?").strip()
+        factor = factorPunctuation.sub(" ", label.casefold()).strip()
+        if factor and factor not in tokens:
+            tokens[factor] = label
+    return list(tokens.items())
+
+
+# Function to add the factors of new responses to the factor index, from their ids and (sector, factors) values
+def indexFactors(conn, responseIds, rows):
+    factorRows = [(responseId, factor, label, sector)
+                  for responseId, (sector, factors) in zip(responseIds, rows)
+                  for factor, label in tokeniseFactors(factors)]
+    conn.executemany(insertResponseFactorSql, factorRows)
+
+    # Add up the batch first, so each count is only updated once however many responses gave the factor
+    factorTotals, sectorTotals = {}, {}
+    for responseId, factor, label, sector in factorRows:
+        factorTotals.setdefault(factor, [label, 0, responseId])[1] += 1
+        if sector is not None:
+            sectorTotals.setdefault((sector, factor), [label, 0, responseId])[1] += 1
+    conn.executemany(addFactorCountSql, [(factor, *total) for factor, total in factorTotals.items()])
+    conn.executemany(addFactorSectorCountSql, [(sector, factor, *total) for (sector, factor), total in sectorTotals.items()])
+
+
+# Function to write a list of (sector, factors, payGap, gov) responses in a single transaction
+@metrics.timed('sqlite_query_duration_seconds', query='insertResponses')
+def insertResponses(rows):
+    conn = getConnection()
+    with conn:
+        # Take the write lock straight away, so a writer in another process makes this wait rather than fail
+        conn.execute("BEGIN IMMEDIATE")
+        previousId = conn.execute("SELECT coalesce(max(id), 0) FROM responses").fetchone()[0]
+        conn.executemany(insertResponseSql, rows)
+        
+        # Index the factors of the new responses, which have the ids after the previous largest id as this transaction holds the write lock
+        responseIds = [row[0] for row in conn.execute("SELECT id FROM responses WHERE id > ? ORDER BY id", (previousId,))]
+        indexFactors(conn, responseIds, [(row[0], row[1]) for row in rows])
+
+
+# Function to save a survey response, queuing it for the write-behind thread when that is enabled
+def insertResponse(sector, factors, payGap, gov):
+    if writeBehindEnabled:
+        startWriteBehind()
+        writeQueue.put((sector, factors, payGap, gov))
+    else:
+        insertResponses([(sector, factors, payGap, gov)])
+
+
+# Function to get every survey response
+@metrics.timed('sqlite_query_duration_seconds', query='fetchResponses')
+def fetchResponses():
+    return getConnection().execute(selectResponsesSql).fetchall()
+
+
+# Function to build the WHERE clause and parameters for the sector and gov filters
+def getFilterConditions(sector=None, gov=None):
+    conditions, parameters = [], []
+    if sector is not None:
+        conditions.append("sector = ?")
+        parameters.append(sector)
+    if gov is not None:
+        conditions.append("gov = ?")
+        parameters.append(int(gov))
+    return conditions, parameters
+
+
+# Function to get one page of responses after (or before) a given id, using the id rather than an offset
+@metrics.timed('sqlite_query_duration_seconds', query='fetchResponsePage')
+def fetchResponsePage(pageSize, afterId=None, beforeId=None, sector=None, gov=None):
+    conditions, parameters = getFilterConditions(sector, gov)
+    if beforeId is not None:
+        conditions.append("id < ?")
+        parameters.append(beforeId)
+        order = "DESC"
+    else:
+        conditions.append("id > ?")
+        parameters.append(afterId or 0)
+        order = "ASC"
+
+    # Fetch one extra row to find out if there is another page in the same direction
+    sql = f"{selectResponsesSql} WHERE {' AND '.join(conditions)} ORDER BY id {order} LIMIT ?"
+    rows = getConnection().execute(sql, parameters + [pageSize + 1]).fetchall()
+    hasMore = len(rows) > pageSize
+    rows = rows[:pageSize]
+
+    # Pages read backwards are put back into id order
+    if beforeId is not None:
+        rows.reverse()
+        hasPrevious, hasNext = hasMore, bool(rows) and responseExists(">", rows[-1][0], sector, gov)
+    else:
+        hasPrevious, hasNext = bool(rows) and responseExists("<", rows[0][0], sector, gov), hasMore
+    return rows, hasPrevious, hasNext
+
+
+# Function to check if any matching response has an id before ("<") or after (">") a given id
+@metrics.timed('sqlite_query_duration_seconds', query='responseExists')
+def responseExists(comparison, responseId, sector=None, gov=None):
+    conditions, parameters = getFilterConditions(sector, gov)
+    conditions.append(f"id {comparison} ?")
+    sql = f"SELECT 1 FROM responses WHERE {' AND '.join(conditions)} LIMIT 1"
+    return getConnection().execute(sql, parameters + [responseId]).fetchone() is not None
+
+
+# Function to yield matching responses one at a time from a server-side cursor, without loading them all
+def iterateResponses(sector=None, gov=None, batchSize=500):
+    conditions, parameters = getFilterConditions(sector, gov)
+    sql = selectResponsesSql
+    if conditions:
+        sql += f" WHERE {' AND '.join(conditions)}"
+    sql += " ORDER BY id"
+
+    # Use a separate connection, as the rows may be read while the response is being streamed
+    conn = connect()
+    try:
+        cursor = conn.execute(sql, parameters)
+        while True:
+            rows = cursor.fetchmany(batchSize)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+# Function to get every sector that has responses, for the summary page filter
+@metrics.timed('sqlite_query_duration_seconds', query='fetchSectors')
+def fetchSectors():
+    return [row[0] for row in getConnection().execute("SELECT sector FROM sectorCounts ORDER BY sector").fetchall()]
+
+
+# Function to get the running totals of the responses as a dictionary
+@metrics.timed('sqlite_query_duration_seconds', query='fetchTotals')
+def fetchTotals():
+    conn = getConnection()
+    total, payGapSum, payGapCount, yesCount = conn.execute(
+        "SELECT total, payGapSum, payGapCount, yesCount FROM responseTotals WHERE id = 1").fetchone()
+    sectorMode = conn.execute("SELECT sector FROM sectorCounts ORDER BY count DESC, sector LIMIT 1").fetchone()
+    return {
+        'total': total,
+        'yesCount': yesCount,
+        'noCount': total - yesCount,
+        'payGapMean': payGapSum / payGapCount if payGapCount > 0 else 0.0,
+        'sectorMode': sectorMode[0] if sectorMode else "No responses",
+    }
+
+
+# Function to get the most common factors given at least a minimum number of times, optionally only in one sector.
+# Ties are listed in the order the factors were first given
+@metrics.timed('sqlite_query_duration_seconds', query='fetchCommonFactors')
+def fetchCommonFactors(minimumCount, limit, sector=None):
+    if sector is None:
+        rows = getConnection().execute(
+            "SELECT label FROM factorCounts WHERE count >= ? ORDER BY count DESC, firstId LIMIT ?", (minimumCount, limit)).fetchall()
+    else:
+        rows = getConnection().execute(
+            "SELECT label FROM factorSectorCounts WHERE sector = ? AND count >= ? ORDER BY count DESC, firstId LIMIT ?",
+            (sector, minimumCount, limit)).fetchall()
+    return [row[0] for row in rows]
+
+
+# Function run by the write-behind thread, writing queued responses in batches
+def writeBehindWorker(pending):
+    while True:
+        # Wait for a response, then take any others that are already waiting, up to the batch size
+        rows = [pending.get()]
+        while len(rows) < writeBehindBatchSize:
+            try:
+                rows.append(pending.get_nowait())
+            except queue.Empty:
+                break
+
+        # None is put on the queue to stop the thread once everything before it is written
+        stopping = None in rows
+        rows = [row for row in rows if row is not None]
+        if rows:
+            writeQueuedResponses(rows, stopping)
+        if stopping:
+            return
+
+
+# Function to write a batch of queued responses, which have already been accepted so must not be dropped
+def writeQueuedResponses(rows, stopping):
+    attempt = 0
+    while True:
+        try:
+            insertResponses(rows)
+            return
+        except sqlite3.OperationalError as e:
+            # The database stayed locked for longer than the busy timeout, so wait and write the batch again
+            if stopping and attempt >= writeBehindStopRetries:
+                break
+            metrics.increment('survey_write_behind_retries_total')
+            print(f"Error: Could not save {len(rows)} survey responses, trying again: {e}")
+            time.sleep(min(writeBehindRetryDelay * 2 ** attempt, writeBehindMaxRetryDelay))
+            attempt += 1
+        except sqlite3.Error:
+            break
+
+    # Write the responses one at a time, so only the responses the database rejects are lost
+    for row in rows:
+        try:
+            insertResponses([row])
+        except sqlite3.Error as e:
+            metrics.increment('survey_write_behind_failures_total')
+            print(f"Error: Could not save the survey response {row}: {e}")
+
+
+# Function to write survey submissions from a background thread, started in each process when the first one is saved
+def enableWriteBehind():
+    global writeBehindEnabled
+    writeBehindEnabled = True
+
+
+# Function to start writing survey responses in batches from a background thread
+def startWriteBehind():
+    global writeQueue, writeThread
+    if writeQueue is not None:
+        return
+    with writeBehindLock:
+        if writeQueue is not None:
+            return
+        pending = queue.Queue()
+        writeThread = threading.Thread(target=writeBehindWorker, args=(pending,), name="surveyWriteBehind", daemon=True)
+        writeThread.start()
+        writeQueue = pending
+    # Make sure queued responses are written when the server stops
+    atexit.register(stopWriteBehind)
+
+
+# Function to write any queued responses and stop the write-behind thread
+def stopWriteBehind():
+    global writeQueue, writeThread
+    if writeQueue is None:
+        return
+    writeQueue.put(None)
+    writeThread.join()
+    writeQueue = None
+    writeThread = None
+
+
+# Function run in a child process straight after a fork, as the parent's threads are not copied into it
+def resetAfterFork():
+    global writeQueue, writeThread, writeBehindLock
+    # Anything queued belongs to the parent, the child starts its own thread when it first saves a response
+    writeQueue = None
+    writeThread = None
+    writeBehindLock = threading.Lock()
+
+
+# A connection must not be carried into a forked worker, so the forking thread's connection is closed first
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=closeConnection, after_in_child=resetAfterFork)
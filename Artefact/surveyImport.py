@@ -0,0 +1,101 @@
+# Importing modules
+import json
+import numpy as np
+import pandas as pd
+
+# Fields of each response, in the order they are stored
+responseFields = ['sector', 'factors', 'payGap', 'gov']
+
+# Largest number of responses accepted in one request
+maxBatchSize = 100000
+
+# Content types read as one JSON object per line
+ndjsonMimetypes = ['application/x-ndjson', 'application/ndjson', 'application/jsonl']
+
+# Values accepted for the government question, as the form sends "0" or "1"
+govValues = {True: True, False: False, 1: True, 0: False, "1": True, "0": False, "true": True, "false": False,
+             "yes": True, "no": False}
+
+
+# Function to read a request body as a list of records and the errors for any lines that are not valid JSON
+def parseBody(body, mimetype):
+    errors = {}
+    if mimetype in ndjsonMimetypes:
+        records = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                errors[len(records)] = {'row': f"Invalid JSON: {e.msg}"}
+                records.append(None)
+    elif mimetype == 'application/json':
+        try:
+            records = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e.msg}")
+        # Accept either a list of responses or an object with a list of responses
+        if isinstance(records, dict):
+            records = records.get('responses')
+        if not isinstance(records, list):
+            raise ValueError("Expected a list of responses or an object with a 'responses' list.")
+    else:
+        raise ValueError("Send the responses as application/json or application/x-ndjson.")
+
+    if not records:
+        raise ValueError("No responses were sent.")
+    if len(records) > maxBatchSize:
+        raise ValueError(f"At most {maxBatchSize} responses can be sent at once.")
+    return records, errors
+
+
+# Function to check a batch of records at once, returning the valid rows and the errors for each invalid row
+def validateResponses(records, errors=None):
+    errors = dict(errors or {})
+    isObject = np.array([isinstance(record, dict) for record in records])
+    for position in np.flatnonzero(~isObject):
+        errors.setdefault(int(position), {'row': "Each response must be a JSON object."})
+
+    # Put the fields into columns so each check runs over the whole batch
+    df = pd.DataFrame.from_records([record if isinstance(record, dict) else {} for record in records],
+                                   columns=responseFields)
+    df = df.astype(object)
+    invalid = {}
+
+    # The sector and factors must be non-empty text, anything that is not a string becomes NaN
+    for column in ['sector', 'factors']:
+        df[column] = df[column].map(lambda value: value.strip() if isinstance(value, str) else np.nan)
+        invalid[column] = (df[column].isna() | (df[column] == "")).to_numpy()
+
+    # The pay gap must be a finite number, numbers sent as text are accepted like they are from the form
+    isBool = df['payGap'].map(lambda value: isinstance(value, bool)).to_numpy(dtype=bool)
+    df['payGap'] = pd.to_numeric(df['payGap'], errors='coerce').astype(float)
+    invalid['payGap'] = ~np.isfinite(df['payGap'].to_numpy()) | isBool
+
+    # The government answer defaults to no when it is missing, like the form
+    missingGov = df['gov'].isna().to_numpy()
+    gov = df['gov'].map(lambda value: govValues.get(value.lower() if isinstance(value, str) else value)
+                        if isinstance(value, (bool, int, float, str)) else None)
+    invalid['gov'] = gov.isna().to_numpy() & ~missingGov
+    df['gov'] = gov.where(~missingGov, False)
+
+    # Record a message for each invalid field of each row
+    messages = {
+        'sector': "Sector must be a non-empty string.",
+        'factors': "Factors must be a non-empty string.",
+        'payGap': "Pay gap must be a number.",
+        'gov': "Gov must be true, false, 1 or 0.",
+    }
+    for column, mask in invalid.items():
+        for position in np.flatnonzero(mask & isObject):
+            errors.setdefault(int(position), {})[column] = messages[column]
+
+    # Keep the rows without errors, as plain Python values for sqlite3
+    isValid = np.ones(len(records), dtype=bool)
+    isValid[list(errors)] = False
+    valid = df[isValid]
+    rows = list(zip(valid['sector'].tolist(), valid['factors'].tolist(), valid['payGap'].tolist(),
+                    [bool(value) for value in valid['gov'].tolist()]))
+    rowErrors = [{'row': position, 'errors': errors[position]} for position in sorted(errors)]
+    return rows, rowErrors
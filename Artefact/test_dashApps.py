@@ -0,0 +1,39 @@
+# Importing modules
+import numpy as np
+import pandas as pd
+from dashApps import createTableIndex, getFilterMask, splitFilterPart
+
+# Table laid out like the pay gap tables, with the column types the pipeline saves them with
+frame = pd.DataFrame({
+    'Year': np.array([2013, 2015, 2015, 2021], dtype='int16'),
+    'NACE Rev 2 Sector': pd.Categorical(['Construction (F)', 'Education (P)', 'Construction (F)', 'Education (P)']),
+    'Difference in Earnings (€)': np.array([5000.0, 1250.5, 15000.0, 800.0], dtype='float32'),
+})
+
+
+# Function to get the rows of the table that match a filter query
+def filterRows(filterQuery):
+    return list(np.flatnonzero(getFilterMask(createTableIndex(frame), filterQuery)))
+
+
+# Test that the operator is only read straight after the column name
+def test_splitFilterPart():
+    assert splitFilterPart('{Year} s>= 2015') == ('Year', 'ge', 2015.0)
+    assert splitFilterPart('{Year} scontains 2015') == ('Year', 'contains', '2015')
+    assert splitFilterPart('{NACE Rev 2 Sector} icontains "eq (F)"') == ('NACE Rev 2 Sector', 'contains', 'eq (F)')
+    assert splitFilterPart('Year > 2015') == (None, None, None)
+
+
+# Test the queries Dash sends when a number is typed in the filter box of a column with no declared type
+def test_numberTypedInFilterBox():
+    assert filterRows('{Year} scontains 2015') == [1, 2]
+    assert filterRows('{Difference in Earnings (€)} scontains 5000') == [0, 2]
+    assert filterRows('{Year} datestartswith 2015') == [1, 2]
+
+
+# Test the comparison operators Dash sends for a number typed after an operator
+def test_comparisonOperators():
+    assert filterRows('{Year} s= 2015') == [1, 2]
+    assert filterRows('{Year} s> 2015') == [3]
+    assert filterRows('{Difference in Earnings (€)} s<= 1250.5') == [1, 3]
+    assert filterRows('{Year} s>= 2015 && {NACE Rev 2 Sector} icontains education') == [1, 3]
@@ -0,0 +1,34 @@
+# Importing modules
+import gc
+import time
+import app
+import surveyDatabase
+
+# Function to load the datasets, Dash apps and earnings cube once, before a server forks its worker processes
+def preload():
+    preloadStart = time.perf_counter()
+    app.preloadDashApps()
+    import dataStore
+    import earningsCube
+    import payGap
+    
+    # Build the parts of the data snapshot the first requests would otherwise wait for
+    for name in ['genderPayGap', 'sectorSummary', 'sexSummary', 'yearSummary']:
+        dataStore.getPart(('tableIndex', name))
+    for key in ['seriesIndexes', 'headlinePayGap']:
+        dataStore.getPart(key)
+    payGap.getCubePayGap(earningsCube.getCube())
+    
+    # Close the connection opened while loading, so no connection is carried into the workers
+    surveyDatabase.closeConnection()
+    
+    # Move everything loaded so far out of the garbage collector's reach, so collections in the workers
+    # do not write to the shared pages and make each worker copy them
+    gc.collect()
+    gc.freeze()
+    print(f"Preloaded the Dash apps and earnings cube in {time.perf_counter() - preloadStart:.2f}s")
+
+preload()
+
+# The WSGI application served by gunicorn (wsgi:application) or waitress
+application = app.server